@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This module downloads the tvg-logo of each show and writes it next to its .strm files.
+Logos are fetched once per distinct URL by a bounded thread pool, each thread reusing one
+HTTP session so connections to a host are kept alive. Downloaded images are stored in a
+content-addressed cache, revalidated with ETag / Last-Modified, and the least recently
+used ones are evicted once the cache exceeds its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fetch import USER_AGENT
+from naming import get_naming_rules
+from process import ARTWORK_FILES
+
+# Directory holding the cached images and the table of their URLs
+LOGO_CACHE_DIR = ".m3u2files-logos"
+
+# Total size of the cached images above which the least recently used ones are removed
+DEFAULT_LOGO_CACHE_BYTES = 512 * 1024 * 1024
+
+# Number of logos downloaded at the same time
+DEFAULT_LOGO_WORKERS = 8
+
+# Images larger than this are not downloaded
+MAX_LOGO_BYTES = 10 * 1024 * 1024
+
+# (connect, read) timeouts in seconds
+LOGO_TIMEOUT = (5, 30)
+
+# File of the cache directory mapping logo URLs to their image hash and validators
+URLS_FILE = "urls.json"
+
+class LogoCache:
+    """
+    A content-addressed cache of downloaded images.
+
+    Images are stored under the SHA-1 of their content, so identical images served from
+    several URLs are stored once. A cached image's mtime is its last use.
+    """
+
+    def __init__(self, directory=LOGO_CACHE_DIR, max_bytes=DEFAULT_LOGO_CACHE_BYTES):
+        """
+        :param directory: Directory holding the cache. It is created if needed.
+        :param max_bytes: Size limit of the cached images.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "images"), exist_ok=True)
+        try:
+            with open(os.path.join(directory, URLS_FILE), "r") as file:
+                self.urls = json.load(file)
+        except (OSError, ValueError):
+            self.urls = {}
+
+    def image_path(self, digest):
+        return os.path.join(self.directory, "images", digest)
+
+    def save(self):
+        """Write the table of URLs."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump(self.urls, file)
+        os.replace(temp_path, os.path.join(self.directory, URLS_FILE))
+
+    def fetch(self, url, session, timeout=LOGO_TIMEOUT):
+        """
+        Get the image of a URL, downloading it only if the cached copy is missing or stale.
+
+        :param url: The logo URL.
+        :param session: The requests.Session to use.
+        :param timeout: requests timeout, as a number or a (connect, read) tuple.
+        :return: A tuple of (path of the cached image, 'downloaded' or 'revalidated').
+        """
+        with self.lock:
+            known = self.urls.get(url)
+        headers = {"User-Agent": USER_AGENT}
+        if known and os.path.exists(self.image_path(known["sha1"])):
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+        else:
+            known = None
+
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and known:
+                os.utime(self.image_path(known["sha1"]))  # Mark the image as recently used
+                return self.image_path(known["sha1"]), "revalidated"
+            response.raise_for_status()
+
+            digest = hashlib.sha1()
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            try:
+                size = 0
+                with os.fdopen(fd, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        size += len(chunk)
+                        if size > MAX_LOGO_BYTES:
+                            raise ValueError(f"Logo larger than {MAX_LOGO_BYTES} bytes")
+                        digest.update(chunk)
+                        file.write(chunk)
+                if size == 0:
+                    raise ValueError("Empty logo")
+                image_path = self.image_path(digest.hexdigest())
+                os.replace(temp_path, image_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+            with self.lock:
+                self.urls[url] = {
+                    "sha1": digest.hexdigest(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+        return image_path, "downloaded"
+
+    def evict(self):
+        """
+        Remove the least recently used images until the cache fits in `max_bytes`.
+
+        :return: The number of images removed.
+        """
+        images_dir = os.path.join(self.directory, "images")
+        images = []
+        for name in os.listdir(images_dir):
+            stat = os.stat(os.path.join(images_dir, name))
+            images.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in images)
+        removed = set()
+        for _, size, name in sorted(images):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(images_dir, name))
+            total -= size
+            removed.add(name)
+
+        if removed:
+            with self.lock:
+                self.urls = {url: known for url, known in self.urls.items() if known["sha1"] not in removed}
+        return len(removed)
+
+def collect_show_logos(entries, show_logos):
+    """
+    Pass entries through while recording the first tvg-logo of each show.
+
+    Wrap the entries given to a writer with this to learn the logos without a second pass.
+
+    :param entries: Iterable of entry dictionaries.
+    :param show_logos: Dictionary filled with show name -> logo URL.
+    :return: A generator over the same entries.
+    """
+    show_name_of = get_naming_rules().show_name
+    for entry in entries:
+        tvg_name = entry.get('tvg_name')
+        logo = entry.get('tvg_logo')
+        if tvg_name and logo:
+            show_logos.setdefault(show_name_of(tvg_name), logo)
+        yield entry
+
+def same_content(path, image_path):
+    """Tell whether a file exists with the same content as a cached image."""
+    if not os.path.exists(path) or os.path.getsize(path) != os.path.getsize(image_path):
+        return False
+    with open(path, "rb") as file, open(image_path, "rb") as image:
+        return file.read() == image.read()
+
+def write_show_artwork(show_logos, library_path="VOD Files", max_workers=DEFAULT_LOGO_WORKERS, cache=None):
+    """
+    Download the logo of each show and write it into the show's folder as ARTWORK_FILES.
+
+    Each distinct logo URL is fetched once, even when several shows share it. Files that
+    already hold the same image are left alone so media servers do not see a change.
+
+    :param show_logos: Dictionary mapping show names (folder names) to logo URLs, e.g.
+                       filled by `collect_show_logos`.
+    :param library_path: Path to the library directory holding the show folders.
+    :param max_workers: Number of logos downloaded at the same time.
+    :param cache: The LogoCache to use. Defaults to one in LOGO_CACHE_DIR.
+    :return: A dictionary with the 'shows', 'downloaded', 'revalidated', 'written',
+             'unchanged' and 'failed' counts and the list of 'failures'.
+    """
+    # requests is slow to import; only load it when artwork is actually written
+    import requests
+
+    cache = cache or LogoCache()
+    summary = {"shows": len(show_logos), "downloaded": 0, "revalidated": 0, "written": 0, "unchanged": 0,
+               "failed": 0, "failures": []}
+    local = threading.local()
+
+    def fetch(url):
+        # One session per thread keeps the connections to each host alive
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            return cache.fetch(url, session)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    urls = sorted(set(show_logos.values()))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        images = dict(zip(urls, executor.map(fetch, urls)))
+
+    for url, (image_path, outcome) in images.items():
+        if image_path is None:
+            summary["failures"].append((url, outcome))
+        else:
+            summary[outcome] += 1
+
+    for show_name, url in show_logos.items():
+        image_path = images[url][0]
+        folder = os.path.join(library_path, show_name)
+        if image_path is None or not os.path.isdir(folder):
+            summary["failed"] += 1
+            continue
+        for file_name in ARTWORK_FILES:
+            path = os.path.join(folder, file_name)
+            if same_content(path, image_path):
+                summary["unchanged"] += 1
+            else:
+                # Replace rather than overwrite; the file may be hard-linked into the previous library
+                if os.path.lexists(path):
+                    os.remove(path)
+                shutil.copyfile(image_path, path)
+                summary["written"] += 1
+
+    cache.evict()
+    cache.save()
+
+    print(f"Artwork for {summary['shows']} shows: {summary['downloaded']} logos downloaded, "
+          f"{summary['revalidated']} revalidated, {summary['written']} files written, {summary['failed']} failed.")
+    for url, error in summary["failures"]:
+        print(f"Failed to download logo {url}: {error}")
+    return summary
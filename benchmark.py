@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+This script benchmarks the processing pipeline on synthetic M3U playlists.
+It generates playlists with realistic attribute mixes, group counts and series/episode
+naming, then times and memory-profiles parsing, filtering, unique-title extraction and
+every output backend (directory tree, zip archive and an in-memory NAS). Results are
+written as JSON so that runs can be compared.
+
+Usage:
+    python benchmark.py --entries 10000 100000 --groups 500 --output results.json
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import posixpath
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import process
+
+# Every stage that can be benchmarked, in the order they run
+STAGES = ("parse", "parse_cached", "filter", "unique_titles", "group_titles", "build_index", "write_tree", "write_zip",
+          "write_nas")
+
+# Shares of movies, series episodes and live channels in a generated playlist
+CONTENT_MIX = (("movie", 0.3), ("series", 0.6), ("live", 0.1))
+
+LANGUAGES = ("EN", "FR", "DE", "ES", "IT", "NL", "PT", "AR", "TR", "PL")
+GENRES = ("Action", "Comedy", "Drama", "Kids", "Documentary", "Horror", "Sci-Fi", "Sports", "News", "Music")
+WORDS = ("The", "Last", "Night", "City", "Blue", "Dark", "House", "Road", "Secret", "River", "King",
+         "Story", "Lost", "Wild", "Star", "Fire", "Island", "Dream", "Empire", "Shadow")
+
+def generate_playlist(path, entries, groups=500, seed=0):
+    """
+    Write a synthetic M3U playlist.
+
+    Series entries are named "<Show> SNN ENN" (some with a " | 4K" suffix), movies carry
+    a year, and live channels have a tvg-id. Group sizes follow a skewed distribution.
+
+    :param path: Path of the playlist to write.
+    :param entries: Number of entries to generate.
+    :param groups: Number of distinct group titles.
+    :param seed: Random seed, so that runs are reproducible.
+    :return: The list of generated group titles.
+    """
+    rng = random.Random(seed)
+    group_titles = [
+        f"{rng.choice(LANGUAGES)} | {rng.choice(GENRES)} {kind.upper()} {index}"
+        for index, kind in ((i, rng.choice(("vod", "series", "live"))) for i in range(groups))
+    ]
+    # Skewed group sizes: a few large groups and a long tail of small ones
+    group_weights = [1.0 / (rank + 1) ** 0.8 for rank in range(groups)]
+    kinds, kind_weights = zip(*CONTENT_MIX)
+
+    shows = max(1, entries // 40)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("#EXTM3U\n")
+        for index in range(entries):
+            kind = rng.choices(kinds, kind_weights)[0]
+            group = rng.choices(group_titles, group_weights)[0]
+            words = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+
+            if kind == "series":
+                show = f"{words} {index % shows}"
+                name = f"{show} S{rng.randint(1, 12):02d} E{rng.randint(1, 24):02d}"
+                logo = f"http://img.example.com/series/{index % shows}.jpg"
+                url = f"http://provider.example.com:8080/series/user/pass/{1000000 + index}.mkv"
+                tvg_id = ""
+            elif kind == "movie":
+                name = f"{words} ({rng.randint(1950, 2024)})"
+                logo = f"http://img.example.com/movie/{index}.jpg"
+                url = f"http://provider.example.com:8080/movie/user/pass/{2000000 + index}.mp4"
+                tvg_id = ""
+            else:
+                name = f"{rng.choice(LANGUAGES)}: {words} {index}"
+                logo = f"http://img.example.com/live/{index}.png"
+                url = f"http://provider.example.com:8080/user/pass/{3000000 + index}"
+                tvg_id = f"channel{index}.example"
+
+            if rng.random() < 0.05:
+                name += " | 4K"
+
+            file.write(
+                f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-name="{name}" tvg-logo="{logo}" '
+                f'group-title="{group}",{name}\n'
+            )
+            if rng.random() < 0.02:
+                file.write("#EXTVLCOPT:http-user-agent=Mozilla/5.0\n")
+            file.write(url + "\n")
+
+    return group_titles
+
+class MemorySMBConnection:
+    """
+    An in-memory stand-in for a pysmb SMBConnection, with an optional per-call latency.
+    """
+
+    class SharedFile:
+        def __init__(self, filename, is_directory, file_size):
+            self.filename = filename
+            self.isDirectory = is_directory
+            self.file_size = file_size
+
+    def __init__(self, storage, latency=0.0):
+        """
+        :param storage: Dictionary shared by all connections: {"dirs": {path: {name: size or None}}, "files": {path: bytes}}.
+        :param latency: Seconds slept on every call, to mimic a network round trip.
+        """
+        self.storage = storage
+        self.latency = latency
+        self.lock = storage.setdefault("lock", threading.Lock())
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def listPath(self, share, path):
+        self._round_trip()
+        with self.lock:
+            children = self.storage["dirs"].get(path.rstrip("/") or "/")
+            if children is None:
+                raise OSError(f"No such directory: {path}")
+            return [self.SharedFile(name, size is None, size or 0) for name, size in children.items()]
+
+    def createDirectory(self, share, path):
+        self._round_trip()
+        path = path.rstrip("/")
+        with self.lock:
+            self.storage["dirs"].setdefault(path, {})
+            self.storage["dirs"].setdefault(posixpath.dirname(path) or "/", {})[posixpath.basename(path)] = None
+
+    def storeFile(self, share, path, file_obj):
+        self._round_trip()
+        data = file_obj.read()
+        with self.lock:
+            self.storage["files"][path] = data
+            self.storage["dirs"].setdefault(posixpath.dirname(path), {})[posixpath.basename(path)] = len(data)
+
+    def retrieveFile(self, share, path, file_obj):
+        self._round_trip()
+        with self.lock:
+            file_obj.write(self.storage["files"][path])
+
+    def close(self):
+        pass
+
+def measure(function, track_memory):
+    """
+    Run a function and measure it.
+
+    :param function: The callable to run.
+    :param track_memory: Trace Python allocations to report the peak (slower).
+    :return: A tuple of (result, measurements dictionary).
+    """
+    gc.collect()
+    if track_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = function()
+    measurements = {
+        "wall_seconds": round(time.perf_counter() - started, 4),
+        "cpu_seconds": round(time.process_time() - cpu_started, 4),
+    }
+    if track_memory:
+        measurements["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, measurements
+
+def run_benchmark(entries, groups=500, selected_fraction=0.1, stages=STAGES, track_memory=False,
+                  nas_latency=0.0, seed=0, work_dir=None):
+    """
+    Generate a playlist and benchmark the selected stages on it.
+
+    :param entries: Number of playlist entries.
+    :param groups: Number of distinct group titles.
+    :param selected_fraction: Share of the groups selected for filtering.
+    :param stages: Names of the stages to run, from STAGES.
+    :param track_memory: Report the peak traced memory of each stage.
+    :param nas_latency: Seconds of simulated latency per SMB call for the NAS stage.
+    :param seed: Random seed of the generated playlist.
+    :param work_dir: Directory to work in. A temporary directory is used and removed by default.
+    :return: A dictionary of results.
+    """
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix="m3u2files-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+
+    try:
+        group_titles, generation = measure(lambda: generate_playlist("data.m3u", entries, groups, seed), False)
+        rng = random.Random(seed)
+        selected = rng.sample(group_titles, max(1, int(len(group_titles) * selected_fraction)))
+        with open(process.CONFIG_FILE, "w") as file:
+            json.dump(selected, file)
+
+        results = {
+            "entries": entries,
+            "groups": groups,
+            "selected_groups": len(selected),
+            "playlist_bytes": os.path.getsize("data.m3u"),
+            "generate": generation,
+            "stages": {},
+        }
+
+        def selected_entries():
+            return list(process.iter_matching_entries("data.m3u", selected))
+
+        stage_functions = {
+            "parse": lambda: len(process.makeobject("data.m3u", cache=False)),
+            "filter": lambda: process.filterm3u(),
+            "unique_titles": lambda: len(process.list_unique_titles()),
+            "group_titles": lambda: len(process.get_unique_group_titles(process.makeobject("data.m3u", cache=False))),
+            "build_index": lambda: len(process.build_group_index("data.m3u")["groups"]),
+        }
+
+        for stage in stages:
+            if stage == "parse_cached":
+                # Warm the parse cache first; the measured call loads from it
+                process.makeobject("data.m3u")
+                result, measurements = measure(lambda: len(process.makeobject("data.m3u")), track_memory)
+            elif stage in stage_functions:
+                result, measurements = measure(stage_functions[stage], track_memory)
+            elif stage == "write_tree":
+                matching = selected_entries()
+                result, measurements = measure(
+                    lambda: process.create_folders_and_strm_files(matching, "VOD Files"), track_memory)
+                shutil.rmtree("VOD Files", ignore_errors=True)
+            elif stage == "write_zip":
+                matching = selected_entries()
+                result, measurements = measure(
+                    lambda: process.create_folders_and_strm_files_in_zip(matching, "VOD.zip"), track_memory)
+                measurements["zip_bytes"] = os.path.getsize("VOD.zip")
+            elif stage == "write_nas":
+                matching = selected_entries()
+                storage = {"dirs": {"/": {}}, "files": {}}
+                result, measurements = measure(
+                    lambda: process.write_files_to_nas(
+                        matching, "/VOD Files", {"share": "bench"},
+                        connection_factory=lambda: MemorySMBConnection(storage, nas_latency)),
+                    track_memory)
+            else:
+                raise ValueError(f"Unknown stage: {stage}")
+
+            if isinstance(result, dict):
+                measurements["summary"] = {key: value for key, value in result.items() if key != "failures"}
+            elif isinstance(result, int):
+                measurements["items"] = result
+            results["stages"][stage] = measurements
+
+        return results
+    finally:
+        os.chdir(previous_dir)
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark m3u2files on synthetic playlists.")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000],
+                        help="Playlist sizes to benchmark (e.g. 10000 100000 5000000).")
+    parser.add_argument("--groups", type=int, default=500, help="Number of distinct group titles.")
+    parser.add_argument("--selected-fraction", type=float, default=0.1,
+                        help="Share of the groups selected for filtering and export.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to run.")
+    parser.add_argument("--memory", action="store_true", help="Report peak traced memory (slower).")
+    parser.add_argument("--nas-latency", type=float, default=0.0,
+                        help="Simulated seconds per SMB call in the NAS stage.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the generated playlists.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+
+    # The stages print their own summaries; keep them out of the JSON output
+    for entries in args.entries:
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            run = run_benchmark(entries, args.groups, args.selected_fraction, args.stages, args.memory,
+                                args.nas_latency, args.seed)
+        finally:
+            sys.stdout = stdout
+        report["runs"].append(run)
+        print(f"{entries} entries: " + ", ".join(
+            f"{stage} {result['wall_seconds']}s" for stage, result in run["stages"].items()), file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps an optional SQLite catalog of parsed playlist entries.
+Each load of a playlist is stored as a snapshot, bulk-inserted in one transaction with
+indexes on the group title, show name, tvg-id and URL hash. Groups and shows can then
+be queried without reparsing, two snapshots can be diffed, and the writers can stream
+their entries straight from a query.
+"""
+
+import os
+import sqlite3
+import time
+
+from parse_cache import hash_file
+from naming import get_naming_rules
+from process import iter_entries, url_hash, load_group_matcher
+
+# Database file of the catalog
+CATALOG_FILE = "catalog.sqlite3"
+
+# Number of snapshots kept by default when a new one is loaded
+DEFAULT_KEEP_SNAPSHOTS = 7
+
+# Number of rows inserted per executemany batch
+INSERT_BATCH_SIZE = 10000
+
+# Columns of an entry row, in the order of the dictionaries built by process.make_entry
+ENTRY_COLUMNS = ("tvg_id", "tvg_name", "tvg_logo", "group_title", "title", "url")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    source TEXT,
+    content_hash TEXT,
+    entries INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS entries (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tvg_id TEXT,
+    tvg_name TEXT,
+    tvg_logo TEXT,
+    group_title TEXT,
+    title TEXT,
+    url TEXT,
+    show_name TEXT,
+    url_hash TEXT,
+    PRIMARY KEY (snapshot_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_group ON entries (snapshot_id, group_title, tvg_name);
+CREATE INDEX IF NOT EXISTS entries_show ON entries (snapshot_id, show_name);
+CREATE INDEX IF NOT EXISTS entries_tvg_id ON entries (snapshot_id, tvg_id);
+CREATE INDEX IF NOT EXISTS entries_url_hash ON entries (snapshot_id, url_hash);
+"""
+
+def _in_clause(column, values):
+    """
+    :return: A (SQL condition, parameters) tuple matching `column` against a list of values.
+    """
+    values = list(values)
+    return f"{column} IN ({', '.join('?' * len(values))})", values
+
+class Catalog:
+    """
+    A SQLite catalog of playlist snapshots.
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        """
+        :param path: Path of the database file. It is created if it does not exist.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load_playlist(self, file_path, keep=DEFAULT_KEEP_SNAPSHOTS):
+        """
+        Store a playlist as a new snapshot, unless its content equals the latest snapshot.
+
+        :param file_path: Path to the M3U playlist.
+        :param keep: Number of snapshots to keep; older ones are removed. None keeps all.
+        :return: The id of the snapshot holding the playlist.
+        """
+        content_hash = hash_file(file_path)
+        latest = self.conn.execute(
+            "SELECT id, content_hash FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        if latest is not None and latest["content_hash"] == content_hash:
+            return latest["id"]
+
+        snapshot_id = self.load_entries(iter_entries(file_path), source=os.path.abspath(file_path),
+                                        content_hash=content_hash)
+        if keep is not None:
+            self.prune(keep)
+        # Refresh the planner statistics; without them the diff subqueries scan whole snapshots
+        self.conn.execute("ANALYZE")
+        return snapshot_id
+
+    def load_entries(self, entries, source=None, content_hash=None):
+        """
+        Bulk-insert entries as a new snapshot in a single transaction.
+
+        :param entries: Iterable of entry dictionaries, as built by process.make_entry.
+        :param source: Optional description of where the entries come from.
+        :param content_hash: Optional hash of the source content.
+        :return: The id of the new snapshot.
+        """
+        def rows(snapshot_id):
+            classified = get_naming_rules().iter_classified(entries)
+            for position, (entry, classification) in enumerate(classified):
+                url = entry.get("url")
+                show_name = classification.show if classification is not None else None
+                yield (snapshot_id, position, *(entry.get(column) for column in ENTRY_COLUMNS), show_name,
+                       url_hash(url) if url else "")
+
+        insert = f"INSERT INTO entries VALUES ({', '.join('?' * (len(ENTRY_COLUMNS) + 4))})"
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO snapshots (created, source, content_hash) VALUES (?, ?, ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%S"), source, content_hash))
+            snapshot_id = cursor.lastrowid
+
+            count = 0
+            batch = []
+            for row in rows(snapshot_id):
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self.conn.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+            self.conn.executemany(insert, batch)
+            count += len(batch)
+            self.conn.execute("UPDATE snapshots SET entries = ? WHERE id = ?", (count, snapshot_id))
+        return snapshot_id
+
+    def snapshots(self):
+        """
+        :return: A list of the snapshots as dictionaries, newest first.
+        """
+        return [dict(row) for row in self.conn.execute("SELECT * FROM snapshots ORDER BY id DESC")]
+
+    def latest_snapshot(self, offset=0):
+        """
+        :param offset: 0 for the latest snapshot, 1 for the one before it, and so on.
+        :return: The id of the snapshot, or None if there is none.
+        """
+        row = self.conn.execute("SELECT id FROM snapshots ORDER BY id DESC LIMIT 1 OFFSET ?", (offset,)).fetchone()
+        return row["id"] if row is not None else None
+
+    def prune(self, keep=DEFAULT_KEEP_SNAPSHOTS):
+        """
+        Remove all but the newest `keep` snapshots.
+
+        :return: The number of snapshots removed.
+        """
+        with self.conn:
+            old = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM snapshots ORDER BY id DESC LIMIT -1 OFFSET ?", (keep,))]
+            for snapshot_id in old:
+                self.conn.execute("DELETE FROM entries WHERE snapshot_id = ?", (snapshot_id,))
+                self.conn.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+        return len(old)
+
+    def iter_entries(self, snapshot_id=None, groups=None, show_name=None, tvg_id=None):
+        """
+        Stream the entries of a snapshot from a query, in playlist order.
+
+        The yielded dictionaries have the keys of process.make_entry, so they can be passed
+        to the writers directly.
+
+        :param snapshot_id: The snapshot to read. Defaults to the latest one.
+        :param groups: Optional iterable of group titles to keep.
+        :param show_name: Optional show name to keep.
+        :param tvg_id: Optional tvg-id to keep.
+        :return: A generator of entry dictionaries.
+        """
+        snapshot_id = snapshot_id or self.latest_snapshot()
+        conditions = ["snapshot_id = ?"]
+        parameters = [snapshot_id]
+        if groups is not None:
+            condition, values = _in_clause("group_title", groups)
+            conditions.append(condition)
+            parameters.extend(values)
+        if show_name is not None:
+            conditions.append("show_name = ?")
+            parameters.append(show_name)
+        if tvg_id is not None:
+            conditions.append("tvg_id = ?")
+            parameters.append(tvg_id)
+
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(ENTRY_COLUMNS)} FROM entries WHERE {' AND '.join(conditions)} ORDER BY position",
+            parameters)
+        for row in cursor:
+            yield dict(zip(ENTRY_COLUMNS, row))
+
+    def iter_selected_entries(self, snapshot_id=None):
+        """
+        Stream the entries of the groups selected in the configuration file, including the
+        groups matched by its include/exclude rules.
+
+        :param snapshot_id: The snapshot to read. Defaults to the latest one.
+        :return: A generator of entry dictionaries.
+        """
+        snapshot_id = snapshot_id or self.latest_snapshot()
+        groups = load_group_matcher().select(self.group_counts(snapshot_id))
+        return self.iter_entries(snapshot_id, groups=groups)
+
+    def group_counts(self, snapshot_id=None):
+        """
+        :return: A dictionary mapping each group title of a snapshot to its number of entries.
+        """
+        snapshot_id = snapshot_id or self.latest_snapshot()
+        return {row[0]: row[1] for row in self.conn.execute(
+            "SELECT group_title, COUNT(*) FROM entries WHERE snapshot_id = ? AND group_title IS NOT NULL "
+            "GROUP BY group_title", (snapshot_id,))}
+
+    def show_names(self, snapshot_id=None, groups=None):
+        """
+        :param groups: Optional iterable of group titles to restrict the shows to.
+        :return: A sorted list of the distinct show names of a snapshot.
+        """
+        snapshot_id = snapshot_id or self.latest_snapshot()
+        query = "SELECT DISTINCT show_name FROM entries WHERE snapshot_id = ? AND show_name IS NOT NULL"
+        parameters = [snapshot_id]
+        if groups is not None:
+            condition, values = _in_clause("group_title", groups)
+            query += " AND " + condition
+            parameters.extend(values)
+        return sorted(row[0] for row in self.conn.execute(query, parameters))
+
+    def diff(self, old_snapshot_id, new_snapshot_id, groups=None):
+        """
+        Compare two snapshots.
+
+        Entries are matched on their group title and tvg_name, the same key that decides
+        where the writers put their .strm file. A matched entry whose URL hash differs
+        is 'changed'.
+
+        :param old_snapshot_id: The older snapshot.
+        :param new_snapshot_id: The newer snapshot.
+        :param groups: Optional iterable of group titles to restrict the diff to.
+        :return: A dictionary with the 'added', 'removed' and 'changed' entry dictionaries.
+        """
+        group_condition = ""
+        parameters = []
+        if groups is not None:
+            condition, parameters = _in_clause("a.group_title", groups)
+            group_condition = " AND " + condition
+
+        columns = ", ".join(f"a.{column}" for column in ENTRY_COLUMNS)
+        same_key = "b.snapshot_id = ? AND b.group_title IS a.group_title AND b.tvg_name IS a.tvg_name"
+
+        def query(condition, first, second):
+            sql = (f"SELECT {columns} FROM entries a WHERE a.snapshot_id = ? AND {condition}{group_condition} "
+                   "ORDER BY a.position")
+            rows = self.conn.execute(sql, [first, *([second] * condition.count("?")), *parameters])
+            return [dict(zip(ENTRY_COLUMNS, row)) for row in rows]
+
+        missing = f"NOT EXISTS (SELECT 1 FROM entries b WHERE {same_key})"
+        # Duplicated names only count as changed when none of the old URLs is left
+        changed = (f"EXISTS (SELECT 1 FROM entries b WHERE {same_key}) AND "
+                   f"NOT EXISTS (SELECT 1 FROM entries b WHERE {same_key} AND b.url_hash = a.url_hash)")
+        return {
+            "added": query(missing, new_snapshot_id, old_snapshot_id),
+            "removed": query(missing, old_snapshot_id, new_snapshot_id),
+            "changed": query(changed, new_snapshot_id, old_snapshot_id),
+        }
+
+    def changed_shows(self, old_snapshot_id, new_snapshot_id, groups=None):
+        """
+        Answer "which shows changed between two snapshots?".
+
+        :return: A sorted list of the show names with added, removed or changed entries.
+        """
+        changes = self.diff(old_snapshot_id, new_snapshot_id, groups)
+        classifications = get_naming_rules().classify_all(
+            entry["tvg_name"] for entries in changes.values() for entry in entries)
+        return sorted({classification.show for classification in classifications.values()})
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a compact, columnar store for parsed M3U entries.
+Entries are kept as one list per field instead of one dictionary per channel. Repeated
+strings (group titles, logos, tvg-ids) are interned, group titles are stored as integer
+codes, and the rows of every group are indexed so group filtering is a lookup.
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+
+# Fields of an entry, in the order of the dictionaries built by process.make_entry
+FIELDS = ("tvg_id", "tvg_name", "tvg_logo", "group_title", "title", "url")
+
+# Group code stored for entries without a group-title
+NO_GROUP = -1
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+class Entry(Mapping):
+    """
+    A read-mostly view of one row of an EntryStore that behaves like the entry dictionary.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._store.get_value(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._store.set_value(self._row, key, value)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class EntryStore:
+    """
+    Columnar storage for parsed M3U entries.
+
+    Iterating or indexing yields Entry views that support dict-style access, so existing
+    callers written for lists of dictionaries keep working.
+    """
+
+    def __init__(self, entries=()):
+        """
+        :param entries: Optional iterable of entry dictionaries to load.
+        """
+        self.tvg_ids = []
+        self.tvg_names = []
+        self.tvg_logos = []
+        self.titles = []
+        self.urls = []
+        self.group_codes = array('i')
+        self.groups = []            # Group title of each group code
+        self.group_lookup = {}      # Group title -> group code
+        self.rows_by_group = []     # Group code -> array of row numbers
+        self.columns = {
+            "tvg_id": self.tvg_ids,
+            "tvg_name": self.tvg_names,
+            "tvg_logo": self.tvg_logos,
+            "title": self.titles,
+            "url": self.urls,
+        }
+        self.extend(entries)
+
+    def to_columns(self):
+        """
+        Export the store as plain lists and bytes, e.g. to serialize it with marshal.
+
+        :return: A dictionary of the columns, group titles and packed group arrays.
+        """
+        return {
+            "tvg_ids": self.tvg_ids,
+            "tvg_names": self.tvg_names,
+            "tvg_logos": self.tvg_logos,
+            "titles": self.titles,
+            "urls": self.urls,
+            "groups": self.groups,
+            "group_codes": self.group_codes.tobytes(),
+            "rows_by_group": [rows.tobytes() for rows in self.rows_by_group],
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Rebuild a store exported by `to_columns` without re-adding its entries one by one.
+
+        :param columns: The dictionary returned by `to_columns`.
+        :return: A new EntryStore.
+        """
+        store = cls()
+        for name in ("tvg_ids", "tvg_names", "tvg_logos", "titles", "urls"):
+            getattr(store, name).extend(columns[name])
+        store.group_codes.frombytes(columns["group_codes"])
+        for code, title in enumerate(columns["groups"]):
+            store.groups.append(sys.intern(title))
+            store.group_lookup[store.groups[code]] = code
+            rows = array('I')
+            rows.frombytes(columns["rows_by_group"][code])
+            store.rows_by_group.append(rows)
+        return store
+
+    def group_code(self, group_title):
+        """
+        Get the integer code of a group title, registering it if it is new.
+
+        :param group_title: The group title, or None.
+        :return: The group code, or NO_GROUP for None.
+        """
+        if group_title is None:
+            return NO_GROUP
+        code = self.group_lookup.get(group_title)
+        if code is None:
+            code = len(self.groups)
+            self.groups.append(sys.intern(group_title))
+            self.group_lookup[self.groups[code]] = code
+            self.rows_by_group.append(array('I'))
+        return code
+
+    def append(self, entry):
+        """
+        Add one entry.
+
+        :param entry: A mapping with the keys listed in FIELDS.
+        """
+        row = len(self.urls)
+        tvg_name = entry.get("tvg_name")
+        title = entry.get("title")
+        self.tvg_ids.append(_intern(entry.get("tvg_id")))
+        self.tvg_names.append(tvg_name)
+        self.tvg_logos.append(_intern(entry.get("tvg_logo")))
+        # The display title usually repeats tvg_name; share the string when it does
+        self.titles.append(tvg_name if title == tvg_name else title)
+        self.urls.append(entry.get("url"))
+
+        code = self.group_code(entry.get("group_title"))
+        self.group_codes.append(code)
+        if code != NO_GROUP:
+            self.rows_by_group[code].append(row)
+
+    def extend(self, entries):
+        """
+        Add several entries.
+
+        :param entries: Iterable of mappings with the keys listed in FIELDS.
+        """
+        for entry in entries:
+            self.append(entry)
+
+    def get_value(self, row, key):
+        """Return one field of a row."""
+        if key == "group_title":
+            code = self.group_codes[row]
+            return self.groups[code] if code != NO_GROUP else None
+        return self.columns[key][row]
+
+    def set_value(self, row, key, value):
+        """Replace one field of a row."""
+        if key == "group_title":
+            old_code = self.group_codes[row]
+            if old_code != NO_GROUP:
+                self.rows_by_group[old_code].remove(row)
+            code = self.group_code(value)
+            self.group_codes[row] = code
+            if code != NO_GROUP:
+                rows = self.rows_by_group[code]
+                rows.append(row)
+                if len(rows) > 1 and rows[-2] > row:
+                    self.rows_by_group[code] = array('I', sorted(rows))
+            return
+        self.columns[key][row] = value
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [Entry(self, index) for index in range(len(self))[row]]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("entry index out of range")
+        return Entry(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield Entry(self, row)
+
+    def group_titles(self):
+        """
+        :return: A set of the group titles that have at least one entry.
+        """
+        return {self.groups[code] for code, rows in enumerate(self.rows_by_group) if rows}
+
+    def group_counts(self):
+        """
+        :return: A dictionary mapping each group title to its number of entries.
+        """
+        return {self.groups[code]: len(rows) for code, rows in enumerate(self.rows_by_group) if rows}
+
+    def rows_in_groups(self, group_titles):
+        """
+        Get the row numbers of the entries in the given groups, in playlist order.
+
+        :param group_titles: Iterable of group titles.
+        :return: A sorted list of row numbers.
+        """
+        codes = {self.group_lookup[title] for title in set(group_titles) if title in self.group_lookup}
+        if len(codes) == 1:
+            return list(self.rows_by_group[codes.pop()])
+        rows = []
+        for code in codes:
+            rows.extend(self.rows_by_group[code])
+        rows.sort()
+        return rows
+
+    def in_groups(self, group_titles):
+        """
+        Get the entries in the given groups, in playlist order.
+
+        :param group_titles: Iterable of group titles.
+        :return: A list of Entry views.
+        """
+        return [Entry(self, row) for row in self.rows_in_groups(group_titles)]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+This module joins an XMLTV guide with the selected playlist entries on their tvg-id.
+The guide is parsed incrementally and every element is dropped once handled, so a guide
+of hundreds of MB is read in bounded memory: only the channels and programmes of the
+selected tvg-ids are kept, either streamed into a trimmed XMLTV file or gathered into
+one .nfo sidecar per channel.
+"""
+
+import gzip
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+
+# Default guide file and trimmed guide written from it
+EPG_FILE = "epg.xml"
+FILTERED_EPG_FILE = "epg-filtered.xml"
+
+def selected_channels(entries):
+    """
+    Collect the channels of the entries that carry a tvg-id.
+
+    :param entries: Iterable of entry dictionaries, e.g. from process.iter_matching_entries.
+    :return: A dictionary mapping each tvg-id to the tvg_name (or title) of its first entry.
+    """
+    channels = {}
+    for entry in entries:
+        tvg_id = entry.get('tvg_id')
+        if tvg_id and tvg_id not in channels:
+            channels[tvg_id] = entry.get('tvg_name') or entry.get('title') or tvg_id
+    return channels
+
+def open_guide(path):
+    """Open an XMLTV file for reading, decompressing it if it is gzipped."""
+    file = open(path, "rb")
+    if file.read(2) == b"\x1f\x8b":
+        file.close()
+        return gzip.open(path, "rb")
+    file.seek(0)
+    return file
+
+def element_text(element, tag):
+    """:return: The text of the first `tag` child of an element, or an empty string."""
+    child = element.find(tag)
+    return (child.text or "").strip() if child is not None else ""
+
+def escape_attribute(value):
+    """Escape a value for use in a double-quoted XML attribute."""
+    return (value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&quot;").replace("\n", "&#10;"))
+
+def nfo_names(channels):
+    """
+    Give each channel a distinct .nfo file name.
+
+    Names are the channel names without special characters. When several channels end up
+    with the same name (compared case-insensitively), e.g. two tvg-ids named "CNN", one
+    channel whose name already is that file name keeps it, and the others get a short hash
+    of their tvg-id appended, so the file of a channel does not depend on the playlist order.
+
+    :param channels: Dictionary mapping tvg-ids to channel names.
+    :return: A dictionary mapping each tvg-id to its file name, without extension.
+    """
+    by_name = {}
+    for channel_id, name in channels.items():
+        # Sanitize the file name to avoid issues with invalid characters
+        file_name = "".join(c for c in name if c.isalnum() or c in " _-").strip() or "channel"
+        by_name.setdefault(file_name.lower(), []).append((file_name, channel_id))
+
+    names = {}
+    for candidates in by_name.values():
+        if len(candidates) == 1:
+            file_name, channel_id = candidates[0]
+            names[channel_id] = file_name
+            continue
+        plain = min((channel_id for file_name, channel_id in candidates if channels[channel_id] == file_name),
+                    default=None)
+        for file_name, channel_id in candidates:
+            if channel_id == plain:
+                names[channel_id] = file_name
+            else:
+                digest = hashlib.sha1(channel_id.encode('utf-8')).hexdigest()[:8]
+                names[channel_id] = f"{file_name} {digest}"
+    return names
+
+def write_nfo(path, channel_id, name, programmes):
+    """
+    Write the .nfo sidecar of one channel with its guide.
+
+    :param path: Path of the .nfo file.
+    :param channel_id: The tvg-id of the channel.
+    :param name: The channel name.
+    :param programmes: List of (start, stop, title, description) tuples.
+    """
+    root = ET.Element("channel")
+    ET.SubElement(root, "id").text = channel_id
+    ET.SubElement(root, "title").text = name
+    for start, stop, title, description in sorted(programmes):
+        programme = ET.SubElement(root, "programme", start=start, stop=stop)
+        ET.SubElement(programme, "title").text = title
+        if description:
+            ET.SubElement(programme, "plot").text = description
+
+    temp_path = path + ".tmp"
+    ET.ElementTree(root).write(temp_path, encoding="utf-8", xml_declaration=True)
+    os.replace(temp_path, path)
+
+def filter_guide(guide_path, channels, output_path=FILTERED_EPG_FILE, nfo_directory=None):
+    """
+    Keep only the channels and programmes of the selected tvg-ids of an XMLTV guide.
+
+    The guide is read with `iterparse` and the document is cleared after each top-level
+    element, so memory use depends on the selected channels rather than on the guide.
+
+    :param guide_path: Path of the XMLTV file, plain or gzipped.
+    :param channels: Dictionary mapping the selected tvg-ids to channel names, e.g. from
+                     `selected_channels`.
+    :param output_path: Trimmed XMLTV file to write, or None to skip it.
+    :param nfo_directory: Directory receiving one .nfo sidecar per channel found in the
+                          guide, named by `nfo_names`, or None to skip them.
+    :return: A dictionary with the number of 'channels' and 'programmes' read and the
+             number of 'channels_kept' and 'programmes_kept'.
+    """
+    summary = {"channels": 0, "programmes": 0, "channels_kept": 0, "programmes_kept": 0}
+    # Guides of the selected channels, gathered only when sidecars are written
+    guides = {}
+    output = None
+    temp_path = output_path + ".part" if output_path else None
+
+    try:
+        with open_guide(guide_path) as file:
+            events = ET.iterparse(file, events=("start", "end"))
+            _, root = next(events)
+
+            if output_path:
+                output = open(temp_path, "w", encoding="utf-8")
+                output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                attributes = "".join(f' {name}="{escape_attribute(value)}"' for name, value in root.attrib.items())
+                output.write(f"<tv{attributes}>\n")
+
+            for event, element in events:
+                if event != "end" or element.tag not in ("channel", "programme"):
+                    continue
+
+                if element.tag == "channel":
+                    summary["channels"] += 1
+                    channel_id = element.get("id")
+                    kept = channel_id in channels
+                    if kept:
+                        summary["channels_kept"] += 1
+                        guides.setdefault(channel_id, [])
+                else:
+                    summary["programmes"] += 1
+                    channel_id = element.get("channel")
+                    kept = channel_id in channels
+                    if kept:
+                        summary["programmes_kept"] += 1
+                        if nfo_directory:
+                            guides.setdefault(channel_id, []).append((
+                                element.get("start", ""), element.get("stop", ""),
+                                element_text(element, "title"), element_text(element, "desc")))
+
+                if kept and output:
+                    element.tail = "\n"
+                    output.write(ET.tostring(element, encoding="unicode"))
+
+                # Drop everything parsed so far; channels and programmes are top-level elements
+                root.clear()
+
+        if output:
+            output.write("</tv>\n")
+            output.close()
+            output = None
+            os.replace(temp_path, output_path)
+    finally:
+        if output:
+            output.close()
+            os.remove(temp_path)
+
+    if nfo_directory:
+        os.makedirs(nfo_directory, exist_ok=True)
+        file_names = nfo_names(channels)
+        for channel_id, programmes in guides.items():
+            write_nfo(os.path.join(nfo_directory, f"{file_names[channel_id]}.nfo"), channel_id,
+                      channels[channel_id], programmes)
+
+    return summary
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+This module downloads M3U playlists.
+Downloads are streamed in chunks to a temporary file that is renamed into place once
+complete, interrupted downloads are resumed with Range requests, and ETag /
+Last-Modified validators are kept so an unchanged playlist is not downloaded again.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from process import build_group_index, iter_records, parse_extinf
+
+# File storing the playlist URLs last submitted, one per line
+URL_CONFIG_FILE = "url_config.txt"
+
+# Directory receiving the playlist of each source when several are merged
+SOURCES_DIR = "sources"
+
+# Number of sources downloaded at the same time
+DEFAULT_FETCH_WORKERS = 4
+
+# Browser User-Agent; some providers reject the default one of requests
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Suffixes of the sidecar files kept next to the downloaded playlist
+PARTIAL_SUFFIX = ".part"
+HTTP_CACHE_SUFFIX = ".http.json"
+
+# Size of the chunks read from the response
+CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeouts in seconds; the read timeout applies between chunks
+DEFAULT_TIMEOUT = (10, 60)
+
+def load_urls():
+    """
+    Load the stored source URLs from the local file.
+
+    :return: A list of URLs, in the order they are merged. Blank and '#' lines are ignored.
+    """
+    if not os.path.exists(URL_CONFIG_FILE):
+        return []
+    with open(URL_CONFIG_FILE, "r") as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")]
+
+def load_url():
+    """Load the first stored URL from the local file."""
+    urls = load_urls()
+    return urls[0] if urls else ""
+
+def save_urls(urls):
+    """Save the source URLs to a local file, one per line."""
+    with open(URL_CONFIG_FILE, "w") as file:
+        file.write("\n".join(urls))
+
+def save_url(url):
+    """Save the URL to a local file."""
+    save_urls([url])
+
+def load_http_cache(output_path):
+    """
+    Load the HTTP validators stored for a downloaded file.
+
+    :param output_path: Path of the downloaded file.
+    :return: A dictionary with 'url', 'etag', 'last_modified' and 'partial'. Empty if there is none.
+    """
+    cache_path = output_path + HTTP_CACHE_SUFFIX
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_http_cache(output_path, cache):
+    """
+    Store the HTTP validators of a downloaded file.
+
+    :param output_path: Path of the downloaded file.
+    :param cache: The dictionary to store.
+    """
+    with open(output_path + HTTP_CACHE_SUFFIX, "w") as file:
+        json.dump(cache, file)
+
+def validators(response):
+    """
+    :return: The ETag and Last-Modified headers of a response as a dictionary.
+    """
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def content_range_start(response):
+    """
+    :return: The first byte position of a 206 response's Content-Range header, or None.
+    """
+    match = re.match(r"bytes\s+(\d+)-", response.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+def download_playlist(url, output_path="data.m3u", session=None, timeout=DEFAULT_TIMEOUT, progress=None, index=True):
+    """
+    Download a playlist to `output_path` with a streamed, conditional and resumable request.
+
+    The body is written in chunks to `output_path + PARTIAL_SUFFIX` and renamed into place
+    once complete. gzip/deflate-encoded responses are decoded on the fly. When the previous
+    download of the same URL is still current, the server answers 304 and nothing is written.
+
+    :param url: The playlist URL.
+    :param output_path: Path of the playlist file to write.
+    :param session: Optional requests.Session to reuse.
+    :param timeout: requests timeout, as a number or a (connect, read) tuple.
+    :param progress: Optional callable receiving the number of bytes written so far.
+    :param index: Build the group index of the downloaded playlist.
+    :return: A dictionary with 'status' ('downloaded' or 'not_modified') and 'bytes' written.
+    """
+    # requests is slow to import; only load it when a download actually happens
+    import requests
+
+    session = session or requests.Session()
+    partial_path = output_path + PARTIAL_SUFFIX
+    cache = load_http_cache(output_path)
+    if cache.get("url") != url:
+        cache = {"url": url}
+
+    # Ask for the remainder of an interrupted download of the same resource
+    partial = cache.get("partial") or {}
+    resume_from = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    validator = partial.get("etag") or partial.get("last_modified")
+    if not validator:
+        resume_from = 0
+
+    while True:
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+        if resume_from:
+            headers["Range"] = f"bytes={resume_from}-"
+            headers["If-Range"] = validator
+            # Byte ranges refer to the encoded body, so resume without content encoding
+            headers["Accept-Encoding"] = "identity"
+        elif os.path.exists(output_path):
+            # Only revalidate a complete previous download
+            if cache.get("etag"):
+                headers["If-None-Match"] = cache["etag"]
+            if cache.get("last_modified"):
+                headers["If-Modified-Since"] = cache["last_modified"]
+
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                return {"status": "not_modified", "bytes": 0}
+
+            # A partial file that is already complete gets 416, and a range starting elsewhere
+            # cannot be appended: drop the partial file and download the whole playlist again
+            if resume_from and (response.status_code == 416 or (
+                    response.status_code == 206 and content_range_start(response) != resume_from)):
+                os.remove(partial_path)
+                cache.pop("partial", None)
+                save_http_cache(output_path, cache)
+                resume_from = 0
+                continue
+            response.raise_for_status()  # Raise an error for HTTP codes 4xx/5xx
+
+            if response.status_code == 206:
+                mode = "ab"
+                written = resume_from
+            else:
+                # The server ignored the range or the resource changed: start over
+                mode = "wb"
+                written = 0
+                cache["partial"] = validators(response)
+                save_http_cache(output_path, cache)
+
+            with open(partial_path, mode) as file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(written)
+                file.flush()
+                os.fsync(file.fileno())
+
+            final_validators = cache.get("partial") or validators(response)
+        break
+
+    os.replace(partial_path, output_path)
+    cache.update(final_validators)
+    cache.pop("partial", None)
+    save_http_cache(output_path, cache)
+
+    # Index the group offsets now so the selector and filter can skip full scans
+    if index:
+        build_group_index(output_path)
+
+    return {"status": "downloaded", "bytes": written}
+
+def source_path(url, directory=SOURCES_DIR):
+    """
+    :return: The path the playlist of a source URL is downloaded to.
+    """
+    return os.path.join(directory, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ".m3u")
+
+def merge_playlists(input_paths, output_path):
+    """
+    Stream several playlists into one, dropping duplicate entries.
+
+    An entry is a duplicate when its URL, or its (tvg-id, tvg-name) pair, was already
+    seen in an earlier source. Repeats within one source are kept, since a provider may
+    list the same entry in several groups and group selection happens later. Sources are
+    read one line at a time and only the 64-bit hashes of the keys are kept, so memory
+    depends on the number of unique entries rather than on the size of the sources.
+    Entries without a URL are dropped.
+
+    :param input_paths: Paths of the playlists to merge, in order of preference.
+    :param output_path: Path of the merged playlist. It is replaced once complete.
+    :return: A dictionary with the 'entries_read', 'entries_written', 'duplicates' and
+             'incomplete' counters.
+    """
+    stats = {"entries_read": 0, "entries_written": 0, "duplicates": 0, "incomplete": 0}
+    seen_urls = set()
+    seen_names = set()
+    partial_path = output_path + PARTIAL_SUFFIX
+
+    with open(partial_path, "w", encoding="utf-8") as output_file:
+        output_file.write("#EXTM3U\n")
+        for input_path in input_paths:
+            # Keys of this source only count against the sources after it
+            source_urls = set()
+            source_names = set()
+            for extinf_line, url in iter_records(input_path):
+                stats["entries_read"] += 1
+                if url is None:
+                    stats["incomplete"] += 1
+                    continue
+
+                # The sets only live for this merge, so the per-process salt of hash() does not matter
+                url_key = hash(url)
+                attributes, _ = parse_extinf(extinf_line)
+                tvg_id = attributes.get("tvg-id") or ""
+                tvg_name = attributes.get("tvg-name") or ""
+                name_key = hash((tvg_id, tvg_name)) if tvg_id or tvg_name else None
+                if url_key in seen_urls or (name_key is not None and name_key in seen_names):
+                    stats["duplicates"] += 1
+                    continue
+
+                source_urls.add(url_key)
+                if name_key is not None:
+                    source_names.add(name_key)
+                output_file.write(f"{extinf_line}\n{url}\n")
+                stats["entries_written"] += 1
+            seen_urls |= source_urls
+            seen_names |= source_names
+
+    os.replace(partial_path, output_path)
+    return stats
+
+def download_sources(urls, output_path="data.m3u", max_workers=DEFAULT_FETCH_WORKERS, timeout=DEFAULT_TIMEOUT,
+                     progress=None):
+    """
+    Download several playlists concurrently and merge them into `output_path`.
+
+    Each source is downloaded to its own file in SOURCES_DIR with `download_playlist`, so
+    it keeps its own conditional and resumable requests. The merge only runs again when a
+    source changed or the list of sources did. A source that fails falls back to its
+    previous download if there is one. A URL listed twice is downloaded once, at its first
+    position. With a single URL, the playlist is downloaded to `output_path` directly.
+
+    :param urls: The source URLs, in order of preference for duplicates.
+    :param output_path: Path of the merged playlist.
+    :param max_workers: Number of sources downloaded at the same time.
+    :param timeout: requests timeout, as a number or a (connect, read) tuple.
+    :param progress: Optional callable receiving the number of bytes written so far, over all sources.
+    :return: A dictionary with 'status' ('downloaded' or 'not_modified'), 'bytes' written,
+             one result per source in 'sources' and the merge counters in 'merge'.
+    """
+    # Two workers must not write the same source file; keep the first position of each URL
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        raise ValueError("No playlist URL configured.")
+    if len(urls) == 1:
+        return download_playlist(urls[0], output_path, timeout=timeout, progress=progress)
+
+    # requests is slow to import; only load it when a download actually happens
+    import requests
+
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+    written_by_url = {}
+    lock = threading.Lock()
+
+    def download(url):
+        def report(written):
+            with lock:
+                written_by_url[url] = written
+                total = sum(written_by_url.values())
+            if progress is not None:
+                progress(total)
+
+        try:
+            return download_playlist(url, source_path(url), timeout=timeout, progress=report, index=False)
+        except (requests.RequestException, OSError) as e:
+            # Only network and file errors fall back; a cancellation must stop the fetch
+            if not os.path.exists(source_path(url)):
+                raise
+            return {"status": "failed", "bytes": 0, "error": f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(download, urls))
+    sources = [dict(result, url=url) for url, result in zip(urls, results)]
+    total_bytes = sum(result["bytes"] for result in results)
+
+    # Skip the merge when no source changed and the merged playlist was built from the same sources
+    cache = load_http_cache(output_path)
+    if (os.path.exists(output_path) and cache.get("sources") == urls
+            and all(result["status"] != "downloaded" for result in results)):
+        return {"status": "not_modified", "bytes": 0, "sources": sources}
+
+    merge = merge_playlists([source_path(url) for url in urls], output_path)
+    save_http_cache(output_path, {"sources": urls})
+    build_group_index(output_path)
+    return {"status": "downloaded", "bytes": total_bytes, "sources": sources, "merge": merge}
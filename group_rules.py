@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+This module decides which group titles are selected.
+The selection file holds either a plain list of group titles, or a dictionary with the
+explicit 'groups' plus 'include' and 'exclude' rules. Rules are glob patterns, or regular
+expressions when prefixed with 're:'; both must match the whole group title. All the rules
+compile into one include and one exclude pattern, and the decision for each distinct group
+title is cached, so matching an entry costs a dictionary lookup however many rules there are.
+"""
+
+import fnmatch
+import re
+
+# Prefix marking a rule as a regular expression instead of a glob pattern
+REGEX_PREFIX = "re:"
+
+# Inline flags at the start of a regular expression, such as '(?i)'
+LEADING_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+def scope_inline_flags(expression):
+    """
+    Turn the inline flags at the start of a regular expression into a scoped group.
+
+    Flags such as '(?i)' apply to the whole pattern and are only allowed at its start,
+    so an expression holding them cannot be joined with others: '(?i)EN \\| .*' becomes
+    '(?i:EN \\| .*)', which matches the same titles.
+
+    :param expression: A regular expression.
+    :return: The expression, with its leading flags scoped to it.
+    """
+    match = LEADING_FLAGS.match(expression)
+    if match is None:
+        return expression
+    flags, rest = match.group(1), expression[match.end():]
+    # In verbose mode a trailing comment would swallow the closing parenthesis
+    return f"(?{flags}:{rest}\n)" if "x" in flags else f"(?{flags}:{rest})"
+
+def parse_selection(config):
+    """
+    Normalize the contents of a selection file.
+
+    :param config: The decoded JSON: a list of group titles, or a dictionary with
+                   optional 'groups', 'include' and 'exclude' lists.
+    :return: A dictionary with the 'groups', 'include' and 'exclude' lists.
+    """
+    if isinstance(config, list):
+        return {"groups": config, "include": [], "exclude": []}
+    return {
+        "groups": list(config.get("groups", [])),
+        "include": list(config.get("include", [])),
+        "exclude": list(config.get("exclude", [])),
+    }
+
+def compile_rules(rules):
+    """
+    Compile glob and 're:' rules into a single pattern matching a whole group title.
+
+    :param rules: Iterable of rules, e.g. ['EN | *', 're:^(FR|DE) \\| .*4K'].
+    :return: A compiled pattern, or None if there are no rules.
+    :raises ValueError: If a rule is not a valid regular expression.
+    """
+    rules = list(rules)
+    alternatives = []
+    for rule in rules:
+        if rule.startswith(REGEX_PREFIX):
+            expression = scope_inline_flags(rule[len(REGEX_PREFIX):])
+            # Like the globs, a regular expression has to match the whole title
+            alternative = f"(?:{expression})\\Z"
+            # Report an invalid rule on its own, as it will be compiled with the others
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                raise ValueError(f"Invalid group rule {rule!r}: {e}") from e
+            alternatives.append(alternative)
+        else:
+            alternatives.append(fnmatch.translate(rule))
+    if not alternatives:
+        return None
+    try:
+        return re.compile("|".join(alternatives))
+    except re.error as e:
+        # Each rule compiles on its own, e.g. two rules use the same group name
+        raise ValueError(f"Group rules {list(rules)!r} cannot be combined: {e}") from e
+
+class GroupMatcher:
+    """
+    Tells whether a group title is selected, with `title in matcher`.
+
+    Explicitly listed groups are always selected. Include rules add the groups they match,
+    unless an exclude rule matches them too. Titles may be given as str or as UTF-8 bytes.
+    """
+
+    def __init__(self, groups=(), include=(), exclude=()):
+        """
+        :param groups: Group titles selected explicitly.
+        :param include: Rules selecting more groups.
+        :param exclude: Rules removing groups selected by the include rules.
+        """
+        self.groups = frozenset(groups)
+        self.include_pattern = compile_rules(include)
+        self.exclude_pattern = compile_rules(exclude)
+        self.decisions = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: The decoded JSON of a selection file, as accepted by `parse_selection`.
+        :return: A GroupMatcher.
+        """
+        selection = parse_selection(config)
+        return cls(selection["groups"], selection["include"], selection["exclude"])
+
+    def __contains__(self, group_title):
+        try:
+            return self.decisions[group_title]
+        except KeyError:
+            decision = self.decisions[group_title] = self._decide(group_title)
+            return decision
+
+    def _decide(self, group_title):
+        if group_title is None:
+            return False
+        if isinstance(group_title, bytes):
+            group_title = group_title.decode('utf-8', errors='replace')
+        if group_title in self.groups:
+            return True
+        if self.include_pattern is None or not self.include_pattern.match(group_title):
+            return False
+        return self.exclude_pattern is None or not self.exclude_pattern.match(group_title)
+
+    def select(self, group_titles):
+        """
+        :param group_titles: Iterable of known group titles, e.g. from a group index.
+        :return: The set of those titles that are selected.
+        """
+        return {title for title in group_titles if title in self}
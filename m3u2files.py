@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Headless command-line entry point for m3u2files.
+
+Runs the fetch, group listing, filter and export steps without tkinter or subprocesses,
+so the pipeline can be scheduled (e.g. from cron). Heavy modules are only imported by
+the subcommands that need them.
+
+Usage:
+    python -m m3u2files fetch [URL]
+    python -m m3u2files groups [--counts]
+    python -m m3u2files filter
+    python -m m3u2files export [--format zip|tree|sync|nas]
+    python -m m3u2files catalog [--selected] [--shows]
+    python -m m3u2files epg [GUIDE] [--nfo DIRECTORY]
+    python -m m3u2files rollback [PATH]
+    python -m m3u2files run [URL] [--format zip|tree|sync|nas] [--force]
+    python -m m3u2files watch [URL] [--interval MINUTES] [--once]
+"""
+
+import argparse
+import gc
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+import process
+from metrics import RunReport, add_counters, peak_rss_bytes, REPORT_FILE
+
+# Default input and output files, shared with the GUI
+DATA_FILE = "data.m3u"
+FILTERED_FILE = "data-filtered.m3u"
+
+# Output backends of the export step
+EXPORT_FORMATS = ("zip", "tree", "sync", "nas")
+
+# File recording the state and timings of the watch mode
+WATCH_STATUS_FILE = "watch_status.json"
+
+# Minutes between two refreshes in watch mode
+DEFAULT_WATCH_INTERVAL = 360
+
+def fetch(args, report):
+    """
+    Download the playlist, or download and merge the playlists of every saved URL.
+
+    :return: The download result, with 'status' 'downloaded' or 'not_modified'.
+    """
+    from fetch import download_sources, load_urls, save_url
+
+    urls = [args.url] if args.url else load_urls()
+    if not urls:
+        raise SystemExit("No URL given and none saved in url_config.txt.")
+    # The watch mode only uses the URL it was given, so url_config.txt keeps every source
+    if args.url and args.save_url:
+        save_url(args.url)
+
+    with report.stage("fetch") as metrics:
+        result = download_sources(urls, args.input)
+        add_counters(metrics, result, bytes="bytes_written")
+        add_counters(metrics, result.get("merge"), entries_written="entries_merged")
+
+    for source in result.get("sources", []):
+        if source["status"] == "failed":
+            print(f"Could not fetch {source['url']}, using its previous download: {source['error']}")
+    if result["status"] == "not_modified":
+        print(f"{args.input} is up to date.")
+    elif "merge" in result:
+        merge = result["merge"]
+        print(f"Merged {len(urls)} playlists into {args.input}: {merge['entries_written']} entries, "
+              f"{merge['duplicates']} duplicates removed.")
+    else:
+        print(f"Saved {result['bytes']} bytes to {args.input}.")
+    return result
+
+def groups(args, report):
+    """Print the group titles of the playlist, read from its group index."""
+    with report.stage("groups") as metrics:
+        index = process.get_group_index(args.input)
+        metrics["counters"]["groups"] = len(index["groups"])
+
+    for title in sorted(index["groups"]):
+        if args.counts:
+            print(f"{index['groups'][title]['count']}\t{title}")
+        else:
+            print(title)
+
+def filter_playlist(args, report):
+    """Write the entries of the selected groups to the filtered playlist."""
+    with report.stage("filter") as metrics:
+        if args.workers and args.workers > 1:
+            stats = {}
+            for _ in process.iter_matching_entries(args.input, filtered_output_path=args.filtered, stats=stats,
+                                                   workers=args.workers):
+                pass
+        else:
+            # Nothing is parsed here, so copy the matching records at the byte level
+            stats = process.filter_m3u_bytes(args.input, args.filtered, process.load_group_matcher())
+        add_counters(metrics, stats)
+    print(f"Filtered {stats['entries_matched']} entries into {args.filtered}.")
+
+def export_target(args):
+    """
+    :return: The local path written by the export options of `args`, or None for the nas format.
+    """
+    if args.format == "zip":
+        zip_file_path = args.output or "VOD.zip"
+        return os.path.splitext(zip_file_path)[0] if args.split_by_group else zip_file_path
+    if args.format in ("tree", "sync"):
+        return args.output or "VOD Files"
+    return None
+
+def export(args, report):
+    """
+    Filter the playlist and stream the selected entries into the chosen output in one pass.
+    """
+    with report.stage("export") as metrics:
+        stats = {}
+        entries = process.iter_matching_entries(
+            args.input, filtered_output_path=None if args.no_filtered_file else args.filtered, stats=stats,
+            workers=args.workers)
+
+        show_logos = {}
+        if args.artwork:
+            if args.format not in ("tree", "sync"):
+                raise SystemExit("--artwork needs the tree or sync format.")
+            from artwork import collect_show_logos
+            entries = collect_show_logos(entries, show_logos)
+
+        if args.format == "zip":
+            import zipfile
+
+            compression = zipfile.ZIP_DEFLATED if args.compress else zipfile.ZIP_STORED
+            summary = process.create_folders_and_strm_files_in_zip(
+                entries, args.output or "VOD.zip", compression=compression, update=args.update,
+                split_by_group=args.split_by_group)
+        elif args.format == "tree":
+            summary = process.create_folders_and_strm_files(entries, args.output or "VOD Files")
+        elif args.format == "sync":
+            summary = process.sync_folders_and_strm_files(entries, args.output or "VOD Files")
+        else:
+            if not args.output:
+                raise SystemExit("The nas format needs --output with the folder path on the NAS.")
+            summary = process.write_files_to_nas(entries, args.output)
+
+        add_counters(metrics, stats)
+        add_counters(metrics, summary, written="files_written", skipped="entries_skipped")
+
+    if args.artwork:
+        from artwork import write_show_artwork
+
+        with report.stage("artwork") as metrics:
+            artwork = write_show_artwork(show_logos, args.output or "VOD Files")
+            add_counters(metrics, artwork, downloaded="logos_downloaded", revalidated="logos_revalidated",
+                         written="artwork_written")
+    return summary
+
+def catalog(args, report):
+    """
+    Load the playlist into the SQLite catalog as a snapshot and print what changed since the previous one.
+    """
+    from catalog import Catalog
+
+    with report.stage("catalog") as metrics, Catalog(args.database) as db:
+        snapshot_id = db.load_playlist(args.input)
+        previous_id = db.latest_snapshot(1)
+        if previous_id is None:
+            print(f"Stored {args.input} as snapshot {snapshot_id}; there is no earlier snapshot to compare with.")
+            return
+
+        groups = None
+        if args.selected:
+            known_groups = set(db.group_counts(previous_id)) | set(db.group_counts(snapshot_id))
+            groups = process.load_group_matcher().select(known_groups)
+        changes = db.diff(previous_id, snapshot_id, groups)
+        add_counters(metrics, {kind: len(entries) for kind, entries in changes.items()})
+        print(f"Snapshot {snapshot_id} vs {previous_id}: " + ", ".join(
+            f"{len(entries)} {kind}" for kind, entries in changes.items()) + ".")
+        if args.shows:
+            for show_name in db.changed_shows(previous_id, snapshot_id, groups):
+                print(show_name)
+
+def epg(args, report):
+    """
+    Trim an XMLTV guide to the channels of the selected entries and/or write their .nfo sidecars.
+    """
+    from epg import filter_guide, selected_channels
+
+    if args.no_xmltv and not args.nfo:
+        raise SystemExit("Nothing to write: --no-xmltv needs --nfo.")
+    with report.stage("epg") as metrics:
+        channels = selected_channels(process.iter_matching_entries(args.input, workers=args.workers))
+        summary = filter_guide(args.guide, channels, None if args.no_xmltv else args.output, args.nfo)
+        add_counters(metrics, summary)
+    print(f"Kept {summary['channels_kept']} of {summary['channels']} channels and "
+          f"{summary['programmes_kept']} of {summary['programmes']} programmes "
+          f"for {len(channels)} selected tvg-ids.")
+
+def rollback(args, report):
+    """Swap the library directory or zip file with the version it replaced."""
+    try:
+        process.rollback_library(args.path)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
+
+def run(args, report):
+    """Fetch the playlist, then filter and export it in the same process."""
+    result = fetch(args, report)
+    if result["status"] == "not_modified" and not args.force:
+        print("Playlist unchanged; skipping filter and export (use --force to run them anyway).")
+        return
+    export(args, report)
+
+def load_watch_status(path):
+    """
+    :return: The saved watch status, or an empty dictionary if there is none.
+    """
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_watch_status(path, status):
+    """Write the watch status atomically, so readers never see a partial file."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(status, file, indent=2)
+    os.replace(temp_path, path)
+
+def watch_cycle(args, status):
+    """
+    Run one refresh: fetch the playlist, then export only if something the export depends on changed.
+
+    The content hashes of the playlist, selected_groups.json and naming_rules.json and the
+    export options at the last successful export are kept in the status, so a restarted
+    daemon does not redo an export either. A deleted output is always exported again.
+
+    :param status: The watch status dictionary, updated in place.
+    """
+    from naming import NAMING_RULES_FILE
+    from parse_cache import hash_file
+
+    report = RunReport(profile=args.profile or None)
+    started = time.time()
+    status["last_run"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started))
+    try:
+        try:
+            status["last_fetch"] = fetch(args, report)["status"]
+            status.pop("last_fetch_error", None)
+        except Exception as e:
+            # A selection change can still be applied to the playlist downloaded last time
+            if not os.path.exists(args.input):
+                raise
+            status["last_fetch"] = "failed"
+            status["last_fetch_error"] = f"{type(e).__name__}: {e}"
+            print(f"Fetch failed, using the existing {args.input}: {status['last_fetch_error']}")
+
+        # Hashing a large playlist is slow; trust a 304 when the file was not touched since
+        stat = os.stat(args.input)
+        fingerprint = [stat.st_size, stat.st_mtime_ns]
+        if status["last_fetch"] == "not_modified" and fingerprint == status.get("playlist_fingerprint"):
+            playlist_hash = status.get("playlist_hash")
+        else:
+            playlist_hash = hash_file(args.input)
+        selection_hash = hash_file(process.CONFIG_FILE) if os.path.exists(process.CONFIG_FILE) else None
+        naming_hash = hash_file(NAMING_RULES_FILE) if os.path.exists(NAMING_RULES_FILE) else None
+        # Everything that decides what the export writes, and where
+        target = [args.format, args.output, args.split_by_group, args.compress, args.artwork]
+        target_path = export_target(args)
+
+        if ((playlist_hash, selection_hash, naming_hash, target)
+                == (status.get("playlist_hash"), status.get("selection_hash"), status.get("naming_hash"),
+                    status.get("export_target"))
+                and (target_path is None or os.path.exists(target_path))):
+            status["last_result"] = "unchanged"
+            status["playlist_fingerprint"] = fingerprint
+            print("Playlist, selection, naming rules and export options unchanged; nothing to export.")
+        else:
+            # Export to the format chosen; sync and zip --update only apply the changed entries
+            summary = export(args, report)
+            status["last_result"] = "exported"
+            status["last_export"] = status["last_run"]
+            status["last_summary"] = {key: value for key, value in summary.items() if key != "failures"}
+            status["playlist_hash"] = playlist_hash
+            status["playlist_fingerprint"] = fingerprint
+            status["selection_hash"] = selection_hash
+            status["naming_hash"] = naming_hash
+            status["export_target"] = target
+        status.pop("last_error", None)
+    except Exception as e:
+        status["last_result"] = "error"
+        status["last_error"] = f"{type(e).__name__}: {e}"
+        print(f"Refresh failed: {status['last_error']}")
+    finally:
+        if report.stages:
+            report.save(args.report)
+        status["last_stages"] = {stage["stage"]: stage["wall_seconds"] for stage in report.stages}
+        status["last_wall_seconds"] = round(time.time() - started, 3)
+        status["runs"] = status.get("runs", 0) + 1
+        # Drop this cycle's objects before sleeping, so memory does not creep over days
+        del report
+        gc.collect()
+        status["peak_rss_bytes"] = peak_rss_bytes()
+    return status
+
+def watch(args, report):
+    """
+    Refresh the library on a schedule until interrupted.
+
+    Every interval, the saved URL is fetched with a conditional request. Filtering and
+    export only run when the playlist content or selected_groups.json changed since the
+    last export. The default sync format then rewrites only the changed .strm files.
+    """
+    stop = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+
+    status = load_watch_status(args.status)
+    while not stop.is_set():
+        watch_cycle(args, status)
+        if args.once:
+            status["next_run"] = None
+            save_watch_status(args.status, status)
+            break
+        status["next_run"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() + args.interval * 60))
+        save_watch_status(args.status, status)
+        stop.wait(args.interval * 60)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="m3u2files", description="Turn M3U playlists into .strm libraries.")
+    parser.add_argument("--input", default=DATA_FILE, help="Playlist file (default: data.m3u).")
+    parser.add_argument("--report", default=REPORT_FILE, help="Where to write the JSON run report.")
+    parser.add_argument("--profile", action="store_true", help="Dump a cProfile of each stage into profiles/.")
+    parser.add_argument("--workers", type=int, help="Parse the playlist on this many processes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = subparsers.add_parser("fetch", help="Download the playlist.")
+    fetch_parser.add_argument("url", nargs="?", help="Playlist URL (default: the saved one).")
+    fetch_parser.set_defaults(handler=fetch, save_url=True)
+
+    groups_parser = subparsers.add_parser("groups", help="List the group titles of the playlist.")
+    groups_parser.add_argument("--counts", action="store_true", help="Show the number of entries per group.")
+    groups_parser.set_defaults(handler=groups)
+
+    filter_parser = subparsers.add_parser("filter", help="Write the selected groups to data-filtered.m3u.")
+    filter_parser.add_argument("--filtered", default=FILTERED_FILE, help="Filtered playlist to write.")
+    filter_parser.set_defaults(handler=filter_playlist)
+
+    catalog_parser = subparsers.add_parser("catalog",
+                                           help="Snapshot the playlist into the SQLite catalog and diff it.")
+    catalog_parser.add_argument("--database", default="catalog.sqlite3",
+                                help="Catalog database file (default: catalog.sqlite3).")
+    catalog_parser.add_argument("--selected", action="store_true", help="Only diff the selected groups.")
+    catalog_parser.add_argument("--shows", action="store_true", help="List the shows that changed.")
+    catalog_parser.set_defaults(handler=catalog)
+
+    epg_parser = subparsers.add_parser("epg", help="Trim an XMLTV guide to the selected channels.")
+    epg_parser.add_argument("guide", nargs="?", default="epg.xml", help="XMLTV file, plain or gzipped (default: epg.xml).")
+    epg_parser.add_argument("--output", default="epg-filtered.xml", help="Trimmed guide to write.")
+    epg_parser.add_argument("--no-xmltv", action="store_true", help="Do not write the trimmed guide.")
+    epg_parser.add_argument("--nfo", metavar="DIRECTORY", help="Also write one .nfo sidecar per channel here.")
+    epg_parser.set_defaults(handler=epg)
+
+    rollback_parser = subparsers.add_parser("rollback", help="Restore the library replaced by the last export.")
+    rollback_parser.add_argument("path", nargs="?", default="VOD Files",
+                                 help="Library directory or zip file (default: VOD Files).")
+    rollback_parser.set_defaults(handler=rollback)
+
+    def add_export_arguments(subparser, default_format="zip"):
+        subparser.add_argument("--format", choices=EXPORT_FORMATS, default=default_format,
+                               help=f"Output backend (default: {default_format}).")
+        subparser.add_argument("--output", help="Zip file, library directory or NAS folder to write.")
+        subparser.add_argument("--filtered", default=FILTERED_FILE, help="Filtered playlist written along the way.")
+        subparser.add_argument("--no-filtered-file", action="store_true", help="Do not write the filtered playlist.")
+        subparser.add_argument("--compress", action="store_true", help="Deflate the zip members.")
+        subparser.add_argument("--update", action="store_true", help="Reuse the previous zip when unchanged.")
+        subparser.add_argument("--split-by-group", action="store_true", help="Write one zip per group.")
+        subparser.add_argument("--artwork", action="store_true",
+                               help="Write each show's tvg-logo as poster.jpg and folder.jpg (tree and sync).")
+
+    export_parser = subparsers.add_parser("export", help="Filter and export the selected groups in one pass.")
+    add_export_arguments(export_parser)
+    export_parser.set_defaults(handler=export)
+
+    run_parser = subparsers.add_parser("run", help="Fetch, then filter and export.")
+    run_parser.add_argument("url", nargs="?", help="Playlist URL (default: the saved one).")
+    run_parser.add_argument("--force", action="store_true", help="Export even if the playlist is unchanged.")
+    add_export_arguments(run_parser)
+    run_parser.set_defaults(handler=run, save_url=True)
+
+    watch_parser = subparsers.add_parser("watch", help="Refresh on a schedule, exporting only when something changed.")
+    watch_parser.add_argument("url", nargs="?", help="Playlist URL (default: the saved one).")
+    watch_parser.add_argument("--interval", type=float, default=DEFAULT_WATCH_INTERVAL,
+                              help=f"Minutes between refreshes (default: {DEFAULT_WATCH_INTERVAL}).")
+    watch_parser.add_argument("--status", default=WATCH_STATUS_FILE, help="Status file with the last run's timings.")
+    watch_parser.add_argument("--once", action="store_true", help="Run a single refresh and exit.")
+    add_export_arguments(watch_parser, default_format="sync")
+    watch_parser.set_defaults(handler=watch, save_url=False)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = RunReport(profile=args.profile or None)
+    try:
+        args.handler(args, report)
+    finally:
+        if report.stages:
+            report.save(args.report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
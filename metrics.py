@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+This module records per-stage timings and counters for a fetch, filter and export run.
+Each stage reports its wall and CPU time, peak memory and counters such as bytes read
+and written or entries processed and skipped. The report is saved as JSON, and the
+hot functions of a stage can optionally be profiled with cProfile.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# File the report of the last run is written to
+REPORT_FILE = "run_report.json"
+
+# Directory receiving the cProfile dumps, one .prof file per stage
+PROFILE_DIR = "profiles"
+
+# Environment variables enabling profiling and allocation tracing without code changes
+PROFILE_ENV = "M3U2FILES_PROFILE"
+TRACE_MEMORY_ENV = "M3U2FILES_TRACE_MEMORY"
+
+def peak_rss_bytes():
+    """
+    :return: The peak resident set size of the process in bytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class RunReport:
+    """
+    Collects the metrics of the stages of one run.
+    """
+
+    def __init__(self, profile=None, trace_memory=None, profile_dir=PROFILE_DIR):
+        """
+        :param profile: Dump a cProfile of every stage. Defaults to the PROFILE_ENV variable.
+        :param trace_memory: Trace Python allocations to report each stage's own peak
+                             (slower). Defaults to the TRACE_MEMORY_ENV variable.
+        :param profile_dir: Directory receiving the cProfile dumps.
+        """
+        self.profile = bool(os.environ.get(PROFILE_ENV)) if profile is None else profile
+        self.trace_memory = bool(os.environ.get(TRACE_MEMORY_ENV)) if trace_memory is None else trace_memory
+        self.profile_dir = profile_dir
+        self.started = time.time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure a stage for the duration of a `with` block.
+
+        The block receives the stage's metrics dictionary and can add counters to it with
+        `add_counters`. A stage that raises is recorded with its error.
+
+        :param name: Name of the stage, e.g. 'fetch', 'filter' or 'export'.
+        """
+        metrics = {"stage": name, "counters": {}}
+        profiler = None
+        if self.profile:
+            import cProfile  # Only loaded when profiling is requested
+
+            profiler = cProfile.Profile()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield metrics
+        except BaseException as e:
+            metrics["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            metrics["wall_seconds"] = round(time.perf_counter() - started, 4)
+            metrics["cpu_seconds"] = round(time.process_time() - cpu_started, 4)
+            metrics["peak_rss_bytes"] = peak_rss_bytes()
+            if tracing:
+                metrics["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                metrics["profile"] = os.path.join(self.profile_dir, f"{name}.prof")
+                profiler.dump_stats(metrics["profile"])
+            self.stages.append(metrics)
+
+    def to_dict(self):
+        """
+        :return: The report as a JSON-serializable dictionary.
+        """
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(sum(stage["wall_seconds"] for stage in self.stages), 4),
+            "stages": self.stages,
+        }
+
+    def save(self, path=REPORT_FILE):
+        """
+        Write the report as JSON.
+
+        :param path: Path of the report file.
+        """
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+def add_counters(metrics, summary, **renamed):
+    """
+    Add the numeric values of a summary dictionary to a stage's counters.
+
+    :param metrics: The metrics dictionary yielded by `RunReport.stage`.
+    :param summary: A summary returned by a pipeline function, e.g. {'written': 10, 'skipped': 2}.
+    :param renamed: Optional mapping of summary keys to counter names, e.g. written='files_written'.
+    """
+    if not summary:
+        return
+    for key, value in summary.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            counter = renamed.get(key, key)
+            metrics["counters"][counter] = metrics["counters"].get(counter, 0) + value
+
+def load_report(path=REPORT_FILE):
+    """
+    Load a saved report.
+
+    :param path: Path of the report file.
+    :return: The report dictionary, or None if there is none.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def stage_report(name, path=REPORT_FILE):
+    """
+    Measure a single stage and merge it into the saved report.
+
+    The GUI buttons each run one stage; the report keeps the latest run of every stage.
+
+    :param name: Name of the stage.
+    :param path: Path of the report file.
+    """
+    report = RunReport()
+    try:
+        with report.stage(name) as metrics:
+            yield metrics
+    finally:
+        previous = load_report(path) or {}
+        stages = [stage for stage in previous.get("stages", []) if stage.get("stage") != name]
+        stages.extend(report.stages)
+        report.stages = stages
+        report.save(path)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+This module classifies tvg-names into show, season and episode.
+The naming rules are regular expressions with named groups, compiled into a single
+pattern so a name is classified in one match. Results are memoized per raw tvg-name in
+a bounded LRU cache, because every episode of a show goes through every writer. The
+rules can be configured in a JSON file.
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from group_rules import scope_inline_flags
+
+# Configuration file with custom naming rules
+NAMING_RULES_FILE = "naming_rules.json"
+
+# Number of distinct tvg-names whose classification is kept
+DEFAULT_CACHE_SIZE = 65536
+
+# Literal markers removed from a tvg-name before it is classified
+DEFAULT_STRIP = (" | 4K",)
+
+# Naming rules, tried in order. Each one matches from the start of the name and may
+# capture 'show', 'season' and 'episode'; the first rule that matches wins.
+DEFAULT_RULES = (
+    # The original "Show S01 E02" form, case-sensitive and keeping separators such as a
+    # trailing dot, so existing show folders keep their names
+    r"(?-i:(?P<show>.*?)\sS(?P<season>\d{2})\sE(?P<episode>\d{2}))",
+    r"(?P<show>.*?)[\s._-]+S(?P<season>\d{1,3})[\s._-]*E(?P<episode>\d{1,4})",    # Show.s01e02, Show S1E2
+    # Show 1x02, but not 4x4 nor a title ending in a year such as "Relay 4x100 (2020)"
+    r"(?!.*\(\d{4}\)\s*$)(?P<show>.*?)[\s._-]+(?P<season>\d{1,2})x(?P<episode>\d{2,3})(?=[\s._-]|$)",
+    r"(?P<show>.*?)[\s._-]+Season\s*(?P<season>\d+)[\s._-]*Episode\s*(?P<episode>\d+)",
+)
+
+# Names of the groups a rule may capture
+RULE_FIELDS = ("show", "season", "episode")
+
+# A group capturing one of RULE_FIELDS, '(?P<show>', or a backreference to it, '(?P=show)'
+FIELD_GROUP = re.compile(r"\(\?P([<=])(show|season|episode)(?=[>)])")
+
+Classification = namedtuple("Classification", ["show", "season", "episode"])
+Classification.__doc__ = "The show name of a tvg-name, and its season and episode numbers (None if unknown)."
+
+def compile_rules(rules):
+    """
+    Compile naming rules into one case-insensitive pattern.
+
+    Python does not allow a group name twice in a pattern, so the groups of rule N and
+    their backreferences are renamed to e.g. 'show_N', and the whole rule is wrapped in
+    a group 'rule_N'. The wrapping group closes last, so `match.lastgroup` tells which
+    rule matched. Leading inline flags such as '(?s)' are scoped to their rule.
+
+    :param rules: Iterable of regular expressions.
+    :return: A tuple of (compiled pattern, dictionary mapping each 'rule_N' group to the
+             (show, season, episode) group names of the rule, None for those it lacks).
+    :raises ValueError: If a rule is not a valid regular expression.
+    """
+    rules = list(rules)
+    alternatives = []
+    rule_groups = {}
+    for number, rule in enumerate(rules):
+        names = tuple(f"{field}_{number}" if f"(?P<{field}>" in rule else None for field in RULE_FIELDS)
+        expression = FIELD_GROUP.sub(lambda match: f"(?P{match.group(1)}{match.group(2)}_{number}",
+                                     scope_inline_flags(rule))
+        alternative = f"(?P<rule_{number}>{expression})"
+        # Report an invalid rule on its own, as it will be compiled with the others
+        try:
+            re.compile(alternative, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid naming rule {rule!r}: {e}") from e
+        alternatives.append(alternative)
+        rule_groups[f"rule_{number}"] = names
+    try:
+        return re.compile("|".join(alternatives), re.IGNORECASE), rule_groups
+    except re.error as e:
+        # Each rule compiles on its own, e.g. two rules use the same extra group name
+        raise ValueError(f"Naming rules {rules!r} cannot be combined: {e}") from e
+
+class NamingRules:
+    """
+    A compiled set of naming rules with a memoized classifier.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, strip=DEFAULT_STRIP, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param rules: Regular expressions capturing 'show', 'season' and/or 'episode'.
+        :param strip: Literal markers removed from a name before it is classified.
+        :param cache_size: Maximum number of tvg-names whose classification is kept.
+        """
+        self.pattern, self.rule_groups = compile_rules(rules)
+        self.strip = tuple(strip)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, tvg_name):
+        """
+        Classify one tvg-name. Use `classify`, which caches the result.
+
+        :param tvg_name: The raw tvg_name of an entry.
+        :return: A Classification. The show is the cleaned name when no rule matches.
+        """
+        name = tvg_name
+        for marker in self.strip:
+            if marker in name:
+                name = name.replace(marker, "")
+
+        match = self.pattern.match(name)
+        if match is None:
+            return Classification(name.strip(), None, None)
+
+        show_group, season_group, episode_group = self.rule_groups[match.lastgroup]
+        show = match.group(show_group).strip() if show_group else ""
+        season = match.group(season_group) if season_group else None
+        episode = match.group(episode_group) if episode_group else None
+        return Classification(
+            show or name.strip(),
+            int(season) if season is not None else None,
+            int(episode) if episode is not None else None,
+        )
+
+    def show_name(self, tvg_name):
+        """
+        :return: The show name of a tvg-name, used as its folder name by the writers.
+        """
+        return self.classify(tvg_name)[0]
+
+    def classify_all(self, tvg_names):
+        """
+        Classify many names at once, each distinct name only once.
+
+        :param tvg_names: Iterable of tvg-names. Empty names and None are ignored.
+        :return: A dictionary mapping each distinct name to its Classification.
+        """
+        classifications = {}
+        for tvg_name in tvg_names:
+            if tvg_name and tvg_name not in classifications:
+                classifications[tvg_name] = self.classify(tvg_name)
+        return classifications
+
+    def iter_classified(self, entries):
+        """
+        Pair streamed entries with their classification.
+
+        :param entries: Iterable of entry dictionaries.
+        :return: A generator of (entry, Classification) tuples. The classification is None
+                 for entries without a tvg_name.
+        """
+        classify = self.classify
+        for entry in entries:
+            tvg_name = entry.get('tvg_name')
+            yield entry, classify(tvg_name) if tvg_name else None
+
+def load_naming_rules(path=NAMING_RULES_FILE):
+    """
+    Load naming rules from a JSON file.
+
+    The file holds a dictionary with optional 'rules' (list of regular expressions, tried
+    before the default ones), 'replace_defaults' (use only the given rules), 'strip'
+    (literal markers to remove) and 'cache_size'.
+
+    :param path: Path of the configuration file.
+    :return: A NamingRules. The default rules are used if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return NamingRules()
+    with open(path, "r") as file:
+        config = json.load(file)
+
+    rules = list(config.get("rules", []))
+    if not config.get("replace_defaults"):
+        rules.extend(DEFAULT_RULES)
+    return NamingRules(rules, config.get("strip", DEFAULT_STRIP), config.get("cache_size", DEFAULT_CACHE_SIZE))
+
+# Rules loaded from NAMING_RULES_FILE, reloaded when the file changes
+_naming_rules = {}
+
+def get_naming_rules():
+    """
+    Get the shared naming rules, loading them again only when the configuration file changed.
+
+    Writers should call this once and reuse the result for all their entries.
+
+    :return: A NamingRules.
+    """
+    try:
+        stat = os.stat(NAMING_RULES_FILE)
+        key = (os.path.abspath(NAMING_RULES_FILE), stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        key = None
+    if "rules" not in _naming_rules or _naming_rules["key"] != key:
+        _naming_rules.update(key=key, rules=load_naming_rules())
+    return _naming_rules["rules"]
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+This module writes .strm files to an SMB share on a NAS using pysmb.
+It keeps a bounded pool of connections that write show folders in parallel, lists each
+show folder once to learn what already exists, and skips files whose content is unchanged.
+"""
+
+import io
+import json
+import os
+import posixpath
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Configuration file storing the NAS connection settings
+NAS_CONFIG_FILE = "nas_config.json"
+
+# Number of SMB connections (and writer threads) used by default
+DEFAULT_POOL_SIZE = 4
+
+def load_nas_config():
+    """
+    Load the NAS connection settings from the JSON configuration file.
+
+    The file holds 'host', 'share', 'username' and 'password', and optionally 'port',
+    'client_name', 'server_name', 'domain', 'use_ntlm_v2' and 'is_direct_tcp'.
+
+    :return: A dictionary of settings. Returns an empty dictionary if the file does not exist.
+    """
+    if not os.path.exists(NAS_CONFIG_FILE):
+        return {}
+    with open(NAS_CONFIG_FILE, "r") as file:
+        return json.load(file)
+
+def connect_to_nas(config=None):
+    """
+    Open an authenticated SMB connection to the NAS.
+
+    :param config: Connection settings. Defaults to the contents of NAS_CONFIG_FILE.
+    :return: A connected pysmb SMBConnection.
+    """
+    try:
+        from smb.SMBConnection import SMBConnection
+    except ImportError as e:
+        raise ImportError("Writing to a NAS requires pysmb: pip install pysmb") from e
+
+    config = config or load_nas_config()
+    is_direct_tcp = config.get("is_direct_tcp", True)
+    conn = SMBConnection(
+        config.get("username", ""),
+        config.get("password", ""),
+        config.get("client_name", "m3u2files"),
+        config.get("server_name", config["host"]),
+        domain=config.get("domain", ""),
+        use_ntlm_v2=config.get("use_ntlm_v2", True),
+        is_direct_tcp=is_direct_tcp,
+    )
+    if not conn.connect(config["host"], config.get("port", 445 if is_direct_tcp else 139)):
+        raise ConnectionError(f"Could not authenticate to the NAS at {config['host']}.")
+    return conn
+
+class SMBConnectionPool:
+    """
+    A bounded pool of SMB connections, opened lazily up to `size`.
+    """
+
+    def __init__(self, connection_factory, size=DEFAULT_POOL_SIZE):
+        """
+        :param connection_factory: Callable returning a new connected SMB connection.
+        :param size: Maximum number of open connections.
+        """
+        self.connection_factory = connection_factory
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        A connection that raised an error is closed instead of being returned to the pool.
+        """
+        self.available.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.connection_factory()
+                with self.lock:
+                    self.opened += 1
+
+            try:
+                yield conn
+            except Exception:
+                self._discard(conn)
+                raise
+            else:
+                self.idle.put(conn)
+        finally:
+            self.available.release()
+
+    def _discard(self, conn):
+        with self.lock:
+            self.opened -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+def list_directory(conn, share, path):
+    """
+    List a directory on the share.
+
+    :return: A dictionary mapping names to (is_directory, file_size), or None if the
+             directory does not exist.
+    """
+    try:
+        shared_files = conn.listPath(share, path)
+    except Exception:
+        return None
+    return {
+        shared_file.filename: (shared_file.isDirectory, shared_file.file_size)
+        for shared_file in shared_files
+        if shared_file.filename not in (".", "..")
+    }
+
+def ensure_directory(conn, share, path):
+    """
+    Create a directory and its missing parents on the share.
+
+    :return: The listing of the directory, as returned by `list_directory`.
+    """
+    listing = list_directory(conn, share, path)
+    if listing is not None:
+        return listing
+
+    parent = posixpath.dirname(path.rstrip("/"))
+    if parent and parent != path:
+        ensure_directory(conn, share, parent)
+    conn.createDirectory(share, path)
+    return {}
+
+def write_folders(folders, root_directory, share, pool, verify_content=True):
+    """
+    Write .strm files to the share, one show folder per task.
+
+    Each folder is listed once. Files that already exist with the same size are read
+    back and left alone when the content matches (or trusted on size alone when
+    `verify_content` is False), so unchanged files keep their timestamps.
+
+    :param folders: Dictionary mapping a folder name below `root_directory` to a list of
+                    (file_name, content bytes) tuples.
+    :param root_directory: Path of the library folder on the share.
+    :param share: Name of the SMB share.
+    :param pool: The SMBConnectionPool to write with.
+    :param verify_content: Compare the content of same-sized files before skipping them.
+    :return: A dictionary with the 'written', 'unchanged', 'failed' and 'bytes_written' counts
+             and the list of 'failures' as (path, error message) tuples.
+    """
+    summary = {"written": 0, "unchanged": 0, "failed": 0, "bytes_written": 0, "failures": []}
+    lock = threading.Lock()
+
+    with pool.connection() as conn:
+        root_listing = ensure_directory(conn, share, root_directory)
+
+    def write_folder(folder_name, files):
+        folder_path = posixpath.join(root_directory, folder_name)
+        written = unchanged = bytes_written = 0
+        try:
+            with pool.connection() as conn:
+                if folder_name in root_listing:
+                    listing = list_directory(conn, share, folder_path) or {}
+                else:
+                    # The root listing says the folder is missing, so create it without a lookup
+                    try:
+                        conn.createDirectory(share, folder_path)
+                        listing = {}
+                    except Exception:
+                        listing = ensure_directory(conn, share, folder_path)
+
+                for file_name, content in files:
+                    file_path = posixpath.join(folder_path, file_name)
+                    existing = listing.get(file_name)
+                    if existing is not None and not existing[0] and existing[1] == len(content):
+                        if not verify_content:
+                            unchanged += 1
+                            continue
+                        current = io.BytesIO()
+                        conn.retrieveFile(share, file_path, current)
+                        if current.getvalue() == content:
+                            unchanged += 1
+                            continue
+
+                    conn.storeFile(share, file_path, io.BytesIO(content))
+                    written += 1
+                    bytes_written += len(content)
+        except Exception as e:
+            with lock:
+                summary["failed"] += len(files) - written - unchanged
+                summary["failures"].append((folder_path, str(e)))
+
+        with lock:
+            summary["written"] += written
+            summary["unchanged"] += unchanged
+            summary["bytes_written"] += bytes_written
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for folder_name, files in folders.items():
+            executor.submit(write_folder, folder_name, files)
+
+    return summary
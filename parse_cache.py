@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps an on-disk cache of parsed playlists.
+Parsed entry stores are saved in a compact marshal format under the SHA-1 of the
+playlist content, so an unchanged playlist is loaded instead of parsed again. A small
+table of file sizes and mtimes avoids rehashing files that have not been touched, and
+the least recently used entries are evicted once the cache exceeds its size limit.
+"""
+
+import hashlib
+import json
+import marshal
+import os
+import sys
+import tempfile
+import threading
+
+from entry_store import EntryStore
+
+# Directory holding the cached entry stores
+PARSE_CACHE_DIR = ".m3u2files-cache"
+
+# Total size of the cached files above which the least recently used ones are removed
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Bump when the parser output changes, so entries cached by older versions are not used
+PARSE_CACHE_VERSION = 1
+
+# File of the cache directory mapping playlist paths to their last known size, mtime and key
+PATHS_FILE = "paths.json"
+
+# Suffix of the cached entry stores
+CACHE_SUFFIX = ".entries"
+
+# Header of a cached file: magic, cache version and the Python version marshal wrote it with
+MAGIC = b"M3UC"
+HEADER = MAGIC + bytes((PARSE_CACHE_VERSION, sys.version_info[0], sys.version_info[1]))
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    :return: The SHA-1 hex digest of a file's content.
+    """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ParseCache:
+    """
+    A content-addressed cache of parsed playlists with a size limit and LRU eviction.
+
+    A cached file's mtime is its last use; hits touch it, and eviction removes the oldest first.
+    """
+
+    def __init__(self, directory=PARSE_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: Directory holding the cache. It is created on first save.
+        :param max_bytes: Size limit of the cached files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def load_paths(self):
+        try:
+            with open(os.path.join(self.directory, PATHS_FILE), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_paths(self, paths):
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_atomically(os.path.join(self.directory, PATHS_FILE), json.dumps(paths).encode())
+
+    def write_atomically(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def key_for(self, file_path):
+        """
+        Get the cache key of a playlist: the SHA-1 of its content and of the cache version.
+
+        The content is only hashed again when the file's size or mtime changed since the
+        last lookup.
+
+        :param file_path: Path to the playlist.
+        :return: A (key, stat) tuple, where stat is the os.stat_result the key is valid for.
+        """
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        with self.lock:
+            known = self.load_paths().get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["key"], stat
+
+        key = hashlib.sha1(f"{PARSE_CACHE_VERSION}:{hash_file(file_path)}".encode()).hexdigest()
+        with self.lock:
+            paths = self.load_paths()
+            paths[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}
+            self.save_paths(paths)
+        return key, stat
+
+    def load(self, key):
+        """
+        Load a cached entry store.
+
+        :param key: The cache key returned by `key_for`.
+        :return: The EntryStore, or None on a miss or an unreadable entry.
+        """
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        if not data.startswith(HEADER):
+            return None
+        try:
+            store = EntryStore.from_columns(marshal.loads(data[len(HEADER):]))
+        except (EOFError, ValueError, TypeError, KeyError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return store
+
+    def save(self, key, store):
+        """
+        Cache an entry store and evict old entries if the cache is over its size limit.
+
+        :param key: The cache key returned by `key_for`.
+        :param store: The EntryStore to save.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_atomically(self.entry_path(key), HEADER + marshal.dumps(store.to_columns()))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+
+        :return: The number of entries removed.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def get_or_parse(self, file_path, parse):
+        """
+        Load the parsed entries of a playlist from the cache, or parse and cache them.
+
+        :param file_path: Path to the playlist.
+        :param parse: Callable parsing `file_path` into an EntryStore on a miss.
+        :return: The EntryStore.
+        """
+        key, stat = self.key_for(file_path)
+        store = self.load(key)
+        if store is not None:
+            return store
+
+        store = parse(file_path)
+        # Do not cache the result under the old key if the file changed while it was parsed
+        current = os.stat(file_path)
+        if (current.st_size, current.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            self.save(key, store)
+        return store
+
+    def clear(self):
+        """Remove every cached entry and the table of known paths."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX) or name == PATHS_FILE:
+                os.remove(os.path.join(self.directory, name))
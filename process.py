@@ -7,120 +7,649 @@ It provides functions for filtering, extracting unique group titles, and parsing
 import re
 import json
 import os
+import hashlib
 import shutil  # Ensure this module is imported
-import zipfile
+import mmap
+import threading
+import zlib
+
+# zipfile and concurrent.futures are imported where they are used, so that command-line
+# runs that do not need them start quickly
+
+from entry_store import EntryStore, FIELDS
+from naming import get_naming_rules
+from group_rules import GroupMatcher, parse_selection
 
 # Configuration file storing the list of selected group titles
 CONFIG_FILE = "selected_groups.json"
 
+# Number of threads writing .strm files to the library directory
+DEFAULT_WRITE_WORKERS = 8
+
+# Target size of the byte ranges parsed by each worker process in parallel mode
+PARALLEL_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Name of the manifest kept in the library directory by the incremental sync
+MANIFEST_FILE = ".m3u2files-manifest.json"
+
+# Show artwork written next to the .strm files by the artwork module
+ARTWORK_FILES = ("poster.jpg", "folder.jpg")
+
+# Suffixes of the library being built and of the library it replaced, kept for rollback
+STAGING_SUFFIX = ".staging"
+PREVIOUS_SUFFIX = ".previous"
+
+# Suffix of the sidecar file holding the group-offset index of a playlist
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+
+# Last loaded selection, reused while the configuration file is unchanged
+_selected_groups_cache = {}
+
+def load_selection():
+    """
+    Load the selection from the JSON configuration file.
+
+    The file is only read again when its size or mtime changed since the last call.
+
+    :return: A tuple of (dictionary with the 'groups', 'include' and 'exclude' lists,
+             GroupMatcher built from it).
+    """
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except FileNotFoundError:
+        return parse_selection([]), GroupMatcher()
+    key = (os.path.abspath(CONFIG_FILE), stat.st_size, stat.st_mtime_ns)
+    if _selected_groups_cache.get("key") != key:
+        with open(CONFIG_FILE, "r") as file:
+            selection = parse_selection(json.load(file))
+        matcher = GroupMatcher(selection["groups"], selection["include"], selection["exclude"])
+        _selected_groups_cache.update(key=key, selection=selection, matcher=matcher)
+    return _selected_groups_cache["selection"], _selected_groups_cache["matcher"]
+
 def load_selected_groups():
     """
     Load the selected groups from the JSON configuration file.
 
-    :return: A list of selected group titles. Returns an empty list if the file does not exist.
+    :return: A list of the group titles selected explicitly. Returns an empty list if the
+             file does not exist. Include/exclude rules are applied by `load_group_matcher`.
     """
-    if not os.path.exists(CONFIG_FILE):
-        return []
-    with open(CONFIG_FILE, "r") as file:
-        return json.load(file)
+    return list(load_selection()[0]["groups"])
 
-def filterm3u():
+def load_group_matcher():
     """
-    Filter an M3U file to include only entries matching the selected group titles.
-    The filtered content is written to 'data-filtered.m3u'.
+    Load the selection as a GroupMatcher, which also applies the include/exclude rules.
+
+    The same matcher, with its cached decisions, is returned while the file is unchanged.
+
+    :return: A GroupMatcher; test a group title with `title in matcher`.
     """
-    # File paths
-    input_file_path = 'data.m3u'
-    output_file_path = 'data-filtered.m3u'
+    return load_selection()[1]
+
+def as_group_matcher(selected_groups):
+    """
+    :param selected_groups: A GroupMatcher, an iterable of group titles, or None for the saved selection.
+    :return: A GroupMatcher.
+    """
+    if selected_groups is None:
+        return load_group_matcher()
+    if isinstance(selected_groups, GroupMatcher):
+        return selected_groups
+    return GroupMatcher(selected_groups)
+
+# Matches either one key="value" attribute or the display title that follows the
+# first comma outside of a quoted value, so an #EXTINF line is tokenized in one scan.
+EXTINF_TOKEN_PATTERN = re.compile(r'([\w-]+)="([^"]*)"|,(.*)$')
+
+def parse_extinf(line):
+    """
+    Parse an #EXTINF line into its attributes and display title in a single pass.
 
-    # Load selected group titles
-    selected_groups = set(load_selected_groups())
+    :param line: The #EXTINF line, e.g. '#EXTINF:-1 tvg-name="Show" group-title="TV",Show'.
+    :return: A tuple of (attributes dictionary, display title or None).
+    """
+    attributes = {}
+    title = None
+    for key, value, tail in EXTINF_TOKEN_PATTERN.findall(line):
+        if key:
+            attributes[key] = value
+        else:
+            title = tail.strip()
+            break
+    return attributes, title
+
+def iter_records(path_or_stream):
+    """
+    Lazily read an M3U playlist and yield the raw lines of each entry.
 
-    # List to store filtered M3U lines
-    filtered_lines = []
+    The playlist is read line by line, so memory use does not depend on the file size.
+    Blank lines and other directives (e.g. #EXTVLCOPT) between an #EXTINF line and its
+    URL are skipped.
 
-    # Read and process the input M3U file
-    with open(input_file_path, 'r') as file:
-        m3u_content = file.read()
+    :param path_or_stream: A file path or an open text stream.
+    :return: A generator of (extinf_line, url_line) tuples. url_line is None when the
+             entry has no URL.
+    """
+    if isinstance(path_or_stream, (str, bytes, os.PathLike)):
+        with open(path_or_stream, 'r', encoding='utf-8', errors='replace') as file:
+            yield from iter_records(file)
+        return
 
-    # Split the M3U content into lines
-    lines = m3u_content.strip().split("\n")
+    extinf_line = None
+    for line in path_or_stream:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
 
-    # Loop through lines to find matching group titles
-    for i in range(len(lines)):
-        if lines[i].startswith("#EXTINF"):
-            # Extract group-title metadata using regex
-            group_title_match = re.search(r'group-title="([^"]+)"', lines[i])
-            group_title = group_title_match.group(1) if group_title_match else None
+        if line.startswith("#EXTINF"):
+            # A new entry starts before the previous one got its URL
+            if extinf_line is not None:
+                yield extinf_line, None
+            extinf_line = line
+        elif extinf_line is not None and not line.startswith("#"):
+            yield extinf_line, line
+            extinf_line = None
 
-            # Add lines to filtered list if the group title matches selected groups
-            if group_title and group_title in selected_groups:
-                filtered_lines.append(lines[i])  # Add metadata line
-                if i + 1 < len(lines):          # Add corresponding URL line
-                    filtered_lines.append(lines[i + 1])
+    if extinf_line is not None:
+        yield extinf_line, None
 
-    # Write the filtered lines to the output file
-    with open(output_file_path, 'w') as output_file:
-        output_file.write("\n".join(filtered_lines))
+def make_entry(extinf_line, url):
+    """
+    Build the entry dictionary for one playlist record.
 
-    print(f"Filtered data has been written to {output_file_path}.")
+    :param extinf_line: The #EXTINF line of the record.
+    :param url: The URL line of the record, or None.
+    :return: A dictionary with 'tvg_id', 'tvg_name', 'tvg_logo', 'group_title', 'title' and 'url'.
+    """
+    attributes, title = parse_extinf(extinf_line)
+    return entry_from_attributes(attributes, title, url)
+
+def entry_from_attributes(attributes, title, url):
+    """
+    Build the entry dictionary from an already parsed #EXTINF line.
+
+    :param attributes: The attribute dictionary returned by `parse_extinf`.
+    :param title: The display title returned by `parse_extinf`.
+    :param url: The URL line of the record, or None.
+    :return: A dictionary with 'tvg_id', 'tvg_name', 'tvg_logo', 'group_title', 'title' and 'url'.
+    """
+    return {
+        "tvg_id": attributes.get("tvg-id"),
+        "tvg_name": attributes.get("tvg-name"),
+        "tvg_logo": attributes.get("tvg-logo"),
+        "group_title": attributes.get("group-title") or None,
+        "title": title,
+        "url": url,
+    }
+
+def iter_entries(path_or_stream):
+    """
+    Lazily parse an M3U playlist into entry dictionaries.
+
+    :param path_or_stream: A file path or an open text stream.
+    :return: A generator of dictionaries as built by `make_entry`.
+    """
+    for extinf_line, url in iter_records(path_or_stream):
+        yield make_entry(extinf_line, url)
 
-def makeobject(file_path):
+# group-title lookup on raw bytes, used while indexing without decoding every line
+GROUP_TITLE_BYTES_PATTERN = re.compile(rb'group-title="([^"]+)"')
+
+def file_fingerprint(file_path, sample_size=65536):
     """
-    Parse an M3U file and extract metadata and URLs into a list of dictionaries.
+    Compute a cheap fingerprint of a file from its size, mtime and a hash of its head and tail.
 
-    :return: A list of dictionaries containing parsed metadata and URLs.
+    :param file_path: Path to the file.
+    :param sample_size: Number of bytes hashed at the start and at the end of the file.
+    :return: A dictionary with 'size', 'mtime_ns' and 'hash'.
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.sha1(str(stat.st_size).encode())
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(sample_size))
+        if stat.st_size > sample_size:
+            file.seek(max(sample_size, stat.st_size - sample_size))
+            digest.update(file.read(sample_size))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+
+def build_group_index(file_path, index_path=None):
     """
-    entries = []
-    # file_path = 'data.m3u'
+    Scan a playlist once and write a sidecar index mapping each group-title to its
+    entry count and the byte ranges of its records in the file.
 
-    # Read and process the M3U file
-    with open(file_path, 'r') as file:
-        m3u_content = file.read()
+    Consecutive records of the same group are merged into a single range.
 
-    # Split the M3U content into lines
-    lines = m3u_content.strip().split("\n")
+    :param file_path: Path to the M3U playlist.
+    :param index_path: Path of the index file. Defaults to the playlist path plus INDEX_SUFFIX.
+    :return: The index dictionary.
+    """
+    index_path = index_path or file_path + INDEX_SUFFIX
+    groups = {}
+    current_group = None   # Group of the record being read, None between records
+    last_group = None      # Group of the last indexed record
+    offset = 0
+
+    with open(file_path, 'rb') as file:
+        for line in file:
+            line_start = offset
+            offset += len(line)
+            stripped = line.strip()
+            if not stripped:
+                continue
 
-    # Loop through lines to extract metadata and URLs
-    for i in range(len(lines)):
-        if lines[i].startswith("#EXTINF"):
-            # Extract metadata using regex
-            group_title_match = re.search(r'group-title="([^"]+)"', lines[i])
-            group_title = group_title_match.group(1) if group_title_match else None
+            if stripped.startswith(b"#EXTINF"):
+                match = GROUP_TITLE_BYTES_PATTERN.search(stripped)
+                current_group = match.group(1).decode('utf-8', errors='replace') if match else None
+                if current_group is None:
+                    last_group = None
+                    continue
+
+                group = groups.setdefault(current_group, {"count": 0, "ranges": []})
+                group["count"] += 1
+                if last_group == current_group:
+                    group["ranges"][-1][1] = offset
+                else:
+                    group["ranges"].append([line_start, offset])
+                last_group = current_group
+            elif current_group is not None and not stripped.startswith(b"#"):
+                # URL line closes the record
+                groups[current_group]["ranges"][-1][1] = offset
+                current_group = None
+
+    index = {"version": INDEX_VERSION, "source": file_fingerprint(file_path), "groups": groups}
+    with open(index_path, 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    return index
+
+def load_group_index(file_path, index_path=None):
+    """
+    Load the group-offset index of a playlist if it is still valid for the file on disk.
 
-            tvg_id_match = re.search(r'tvg-id="([^"]*)"', lines[i])
-            tvg_name_match = re.search(r'tvg-name="([^"]*)"', lines[i])
-            tvg_logo_match = re.search(r'tvg-logo="([^"]*)"', lines[i])
+    :param file_path: Path to the M3U playlist.
+    :param index_path: Path of the index file. Defaults to the playlist path plus INDEX_SUFFIX.
+    :return: The index dictionary, or None if it is missing or stale.
+    """
+    index_path = index_path or file_path + INDEX_SUFFIX
+    if not os.path.exists(index_path) or not os.path.exists(file_path):
+        return None
 
-            # Create a dictionary for the current entry
-            entry = {
-                "tvg_id": tvg_id_match.group(1) if tvg_id_match else None,
-                "tvg_name": tvg_name_match.group(1) if tvg_name_match else None,
-                "tvg_logo": tvg_logo_match.group(1) if tvg_logo_match else None,
-                "group_title": group_title,
-                "url": lines[i + 1] if i + 1 < len(lines) else None,
-            }
-            entries.append(entry)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != INDEX_VERSION:
+        return None
+    if index.get("source") != file_fingerprint(file_path):
+        return None
+    return index
+
+def get_group_index(file_path, index_path=None):
+    """
+    Return the group-offset index of a playlist, rebuilding it if it is missing or stale.
 
-    return entries
+    :param file_path: Path to the M3U playlist.
+    :param index_path: Path of the index file. Defaults to the playlist path plus INDEX_SUFFIX.
+    :return: The index dictionary.
+    """
+    return load_group_index(file_path, index_path) or build_group_index(file_path, index_path)
+
+def iter_records_in_ranges(file_path, ranges):
+    """
+    Yield the raw records stored in the given byte ranges of a playlist.
+
+    :param file_path: Path to the M3U playlist.
+    :param ranges: Iterable of [start, end] byte offsets, as stored in the group index.
+    :return: A generator of (extinf_line, url_line) tuples in file order.
+    """
+    def iter_lines(file):
+        for start, end in sorted(ranges):
+            file.seek(start)
+            position = start
+            while position < end:
+                line = file.readline()
+                if not line:
+                    break
+                position += len(line)
+                yield line
+
+    with open(file_path, 'rb') as file:
+        yield from iter_records(iter_lines(file))
+
+def split_at_records(file_path, parts):
+    """
+    Split a playlist into byte ranges that each start at an #EXTINF line.
+
+    :param file_path: Path to the M3U playlist.
+    :param parts: The desired number of ranges. Fewer are returned for small files.
+    :return: A list of (start, end) byte offsets covering the whole file, in order.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+
+    boundaries = [0]
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for part in range(1, parts):
+            target = max(size * part // parts, boundaries[-1])
+            position = data.find(b"\n#EXTINF", target)
+            if position == -1:
+                break
+            if position + 1 > boundaries[-1]:
+                boundaries.append(position + 1)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+def parse_byte_range(file_path, start, end, selected_groups=None, keep_lines=False):
+    """
+    Parse the records in one byte range of a playlist. Runs in a worker process.
+
+    :param file_path: Path to the M3U playlist.
+    :param start: Offset of the first byte, at the start of an #EXTINF line.
+    :param end: Offset just past the last byte.
+    :param selected_groups: Optional set of group titles or GroupMatcher; other records are
+                            dropped here so that they never cross the process boundary.
+    :param keep_lines: Also return the raw #EXTINF line of every kept record.
+    :return: A tuple of (records read, list of (extinf_line or None, entry values in FIELDS order)).
+    """
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8', errors='replace')
+
+    read = 0
+    kept = []
+    for extinf_line, url in iter_records(text.split("\n")):
+        read += 1
+        attributes, title = parse_extinf(extinf_line)
+        if selected_groups is not None and attributes.get("group-title") not in selected_groups:
+            continue
+        entry = entry_from_attributes(attributes, title, url)
+        kept.append((extinf_line if keep_lines else None, tuple(entry[field] for field in FIELDS)))
+    return read, kept
+
+def iter_parsed_parallel(file_path, workers=None, selected_groups=None, keep_lines=False, stats=None):
+    """
+    Parse a playlist on several cores and yield the records in playlist order.
+
+    The file is split at #EXTINF boundaries and the ranges are parsed in a process pool.
+    Only a few ranges are in flight at a time, so memory stays bounded.
+
+    :param file_path: Path to the M3U playlist.
+    :param workers: Number of worker processes. Defaults to the number of CPUs.
+    :param selected_groups: Optional set of group titles or GroupMatcher, applied in the workers.
+    :param keep_lines: Also yield the raw #EXTINF line of every record.
+    :param stats: Optional dictionary whose 'entries_read' counter is increased.
+    :return: A generator of (extinf_line or None, entry dictionary) tuples.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    parts = max(workers * 4, os.path.getsize(file_path) // PARALLEL_CHUNK_SIZE + 1)
+    ranges = split_at_records(file_path, parts)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_range = 0
+        while pending or next_range < len(ranges):
+            # Keep every worker busy with one range queued behind it
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                start, end = ranges[next_range]
+                pending.append(executor.submit(parse_byte_range, file_path, start, end, selected_groups, keep_lines))
+                next_range += 1
+
+            read, kept = pending.pop(0).result()
+            if stats is not None:
+                stats["entries_read"] = stats.get("entries_read", 0) + read
+            for extinf_line, values in kept:
+                yield extinf_line, dict(zip(FIELDS, values))
+
+def iter_matching_entries(input_file_path='data.m3u', selected_groups=None, filtered_output_path=None, stats=None,
+                          workers=None):
+    """
+    Parse, filter and yield the entries of the selected groups in a single pass.
+
+    Each record is parsed once; entries are yielded as soon as they are read so a
+    writer can consume them directly. The matching records can optionally be copied
+    to a filtered M3U file along the way. When a valid group index exists for the
+    playlist, only the byte ranges of the selected groups are read. Otherwise the
+    file can be parsed on several cores with `workers`.
+
+    :param input_file_path: Path to the M3U playlist to read.
+    :param selected_groups: Group titles or GroupMatcher to keep. Defaults to the saved selection.
+    :param filtered_output_path: Optional path of a filtered M3U file to write as well.
+    :param stats: Optional dictionary that receives the 'bytes_read', 'entries_read' and
+                  'entries_matched' counters as the generator is consumed.
+    :param workers: Number of worker processes for a full scan. None or 1 parses in this process.
+    :return: A generator of entry dictionaries matching the selected groups.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({"bytes_read": 0, "entries_read": 0, "entries_matched": 0})
+    selected_groups = as_group_matcher(selected_groups)
+
+    def iter_parsed(records):
+        for extinf_line, url in records:
+            stats["entries_read"] += 1
+            attributes, title = parse_extinf(extinf_line)
+            if attributes.get("group-title") not in selected_groups:
+                continue
+            yield extinf_line, entry_from_attributes(attributes, title, url)
+
+    index = load_group_index(input_file_path) if isinstance(input_file_path, str) else None
+    if index is not None:
+        ranges = [
+            byte_range
+            for group in selected_groups.select(index["groups"])
+            for byte_range in index["groups"][group]["ranges"]
+        ]
+        matches = iter_parsed(iter_records_in_ranges(input_file_path, ranges))
+        stats["bytes_read"] = sum(end - start for start, end in ranges)
+    elif workers and workers > 1 and isinstance(input_file_path, str):
+        matches = iter_parsed_parallel(input_file_path, workers, selected_groups,
+                                       keep_lines=bool(filtered_output_path), stats=stats)
+        stats["bytes_read"] = os.path.getsize(input_file_path)
+    else:
+        matches = iter_parsed(iter_records(input_file_path))
+        if isinstance(input_file_path, str):
+            stats["bytes_read"] = os.path.getsize(input_file_path)
+
+    # Write next to the filtered file and swap it in once complete, so a cancelled run keeps the old one
+    temp_path = filtered_output_path + ".part" if filtered_output_path else None
+    output_file = open(temp_path, 'w', encoding='utf-8') if filtered_output_path else None
+    completed = False
+    try:
+        separator = ""
+        for extinf_line, entry in matches:
+            stats["entries_matched"] += 1
+
+            if output_file is not None:
+                output_file.write(separator + extinf_line)  # Add metadata line
+                separator = "\n"
+                if entry["url"] is not None:               # Add corresponding URL line
+                    output_file.write(separator + entry["url"])
+
+            yield entry
+        completed = True
+    finally:
+        if output_file is not None:
+            output_file.close()
+            if completed:
+                os.replace(temp_path, filtered_output_path)
+            else:
+                os.remove(temp_path)
+
+# Every #EXTINF line, used by the byte-level filter
+EXTINF_LINE_BYTES_PATTERN = re.compile(rb'^#EXTINF[^\n]*', re.MULTILINE)
+
+def filter_m3u_bytes(input_file_path, output_file_path, selected_groups=None):
+    """
+    Copy the records of the selected groups from one playlist to another without decoding them.
+
+    The input is memory-mapped and scanned with bytes patterns. Group titles are compared
+    as UTF-8 bytes, and each run of consecutive matching records is written verbatim
+    through a memoryview slice. When a valid group index exists, its byte ranges are
+    copied directly without scanning.
+
+    :param input_file_path: Path to the M3U playlist to read.
+    :param output_file_path: Path of the filtered M3U file to write.
+    :param selected_groups: Group titles or GroupMatcher to keep. Defaults to the saved selection.
+    :return: A dictionary with the 'bytes_read', 'bytes_written', 'entries_read' and
+             'entries_matched' counters.
+    """
+    # The matcher caches its decision for the raw bytes of each group title
+    selected = as_group_matcher(selected_groups)
+    stats = {"bytes_read": 0, "bytes_written": 0, "entries_read": 0, "entries_matched": 0}
+
+    # Write next to the output and swap it in once complete, so a failed run keeps the old file
+    temp_path = output_file_path + ".part"
+    try:
+        with open(temp_path, 'wb') as output_file:
+            copy_selected_records(input_file_path, output_file, selected, stats)
+        os.replace(temp_path, output_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return stats
+
+def copy_selected_records(input_file_path, output_file, selected, stats):
+    """
+    Write the records of the selected groups to an open binary file, as described in `filter_m3u_bytes`.
+
+    :param input_file_path: Path to the M3U playlist to read.
+    :param output_file: Binary file object to write to.
+    :param selected: GroupMatcher of the groups to keep.
+    :param stats: Dictionary of counters, updated in place.
+    """
+    if os.path.getsize(input_file_path) == 0:
+        return
+
+    with open(input_file_path, 'rb') as input_file, \
+            mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        view = memoryview(data)
+        try:
+            index = load_group_index(input_file_path)
+            if index is not None:
+                groups = selected.select(index["groups"])
+                ranges = sorted(
+                    tuple(byte_range) for group in groups for byte_range in index["groups"][group]["ranges"])
+                stats["entries_read"] = sum(group["count"] for group in index["groups"].values())
+                stats["entries_matched"] = sum(index["groups"][group]["count"] for group in groups)
+            else:
+                ranges = []
+
+                def keep_record(start, line_end, end):
+                    stats["entries_read"] += 1
+                    match = GROUP_TITLE_BYTES_PATTERN.search(data, start, line_end)
+                    if match is None or match.group(1) not in selected:
+                        return
+                    stats["entries_matched"] += 1
+                    if ranges and ranges[-1][1] == start:
+                        ranges[-1] = (ranges[-1][0], end)  # Extend the current run
+                    else:
+                        ranges.append((start, end))
+
+                # A record runs from its #EXTINF line to the next one (or the end of the file)
+                previous = None
+                for match in EXTINF_LINE_BYTES_PATTERN.finditer(data):
+                    if previous is not None:
+                        keep_record(previous.start(), previous.end(), match.start())
+                    previous = match
+                if previous is not None:
+                    keep_record(previous.start(), previous.end(), len(data))
+
+            for start, end in ranges:
+                output_file.write(view[start:end])
+                stats["bytes_written"] += end - start
+            stats["bytes_read"] = sum(end - start for start, end in ranges) if index is not None else len(data)
+        finally:
+            view.release()
+
+def filterm3u(zero_copy=True):
+    """
+    Filter an M3U file to include only entries matching the selected group titles.
+    The filtered content is written to 'data-filtered.m3u'.
+
+    :param zero_copy: Copy the matching records verbatim at the byte level (see
+                      `filter_m3u_bytes`) instead of parsing every line as text.
+    :return: A dictionary with the 'bytes_read', 'bytes_written', 'entries_read' and
+             'entries_matched' counters.
+    """
+    # File paths
+    input_file_path = 'data.m3u'
+    output_file_path = 'data-filtered.m3u'
+
+    if zero_copy:
+        stats = filter_m3u_bytes(input_file_path, output_file_path, load_group_matcher())
+    else:
+        # Drain the pipeline; the filtered file is its only output here
+        stats = {}
+        for _ in iter_matching_entries(input_file_path, filtered_output_path=output_file_path, stats=stats):
+            pass
+        stats["bytes_written"] = os.path.getsize(output_file_path)
+
+    print(f"Filtered data has been written to {output_file_path}.")
+    return stats
+
+def makeobject(file_path, workers=None, cache=True):
+    """
+    Parse an M3U file and extract metadata and URLs into a compact entry store.
+
+    :param file_path: A file path or an open text stream.
+    :param workers: Number of worker processes to parse a file path with. None or 1 parses
+                    in this process.
+    :param cache: Load a file path from the parse cache when its content is unchanged, and
+                  cache it otherwise. True uses the default ParseCache, False disables it,
+                  and a ParseCache instance is used as is.
+    :return: An EntryStore; its entries support the same dict-style access as the parsed dictionaries.
+    """
+    def parse(path):
+        if workers and workers > 1 and isinstance(path, str):
+            return EntryStore(entry for _, entry in iter_parsed_parallel(path, workers))
+        return EntryStore(iter_entries(path))
+
+    if cache and isinstance(file_path, str):
+        from parse_cache import ParseCache
+
+        parse_cache = ParseCache() if cache is True else cache
+        return parse_cache.get_or_parse(file_path, parse)
+    return parse(file_path)
+
+def get_group_titles_from_index(file_path):
+    """
+    Get the group-title values of a playlist from its group index, building the index if needed.
+
+    :param file_path: Path to the M3U playlist.
+    :return: A set of unique group-title values.
+    """
+    return set(get_group_index(file_path)["groups"])
 
 def get_unique_group_titles(entries):
     """
     Extract unique group-title values from a list of channel dictionaries.
 
-    :param entries: List of dictionaries representing channels.
+    :param entries: List of dictionaries representing channels, an EntryStore, or the path
+                    of a playlist, which is loaded through the parse cache.
     :return: A set of unique group-title values.
     """
+    if isinstance(entries, str):
+        entries = makeobject(entries)
+    if isinstance(entries, EntryStore):
+        return entries.group_titles()
     return {entry['group_title'] for entry in entries if 'group_title' in entry}
 
 def get_matching_objects(entries):
     """
     Retrieve objects from the given entries where the group_title matches the selected groups.
 
-    :param entries: List of dictionaries containing channel metadata.
+    :param entries: List of dictionaries containing channel metadata, or an EntryStore.
     :return: List of dictionaries matching the selected group titles.
     """
-    selected_groups = set(load_selected_groups())
+    selected_groups = load_group_matcher()
+    if isinstance(entries, EntryStore):
+        return entries.in_groups(selected_groups.select(entries.group_titles()))
     return [entry for entry in entries if entry.get('group_title') in selected_groups]
 
 def get_show_name(tvg_name):
@@ -128,19 +657,13 @@ def get_show_name(tvg_name):
     Extract the show name from the tvg_name field by removing season/episode markers
     and " | 4K" suffix if present.
 
+    The name is classified by the shared naming rules (see naming.py); writers that handle
+    many entries should take `get_naming_rules().show_name` once instead.
+
     :param tvg_name: The tvg_name string containing the show name, season/episode markers, and suffix.
     :return: The cleaned show name as a string.
     """
-    # Remove " | 4K" if present
-    tvg_name = tvg_name.replace(" | 4K", "")
-
-    # Regex to find season and episode markers (e.g., S01 E02)
-    pattern = r'(.*?)\sS\d{2}\sE\d{2}'
-    match = re.match(pattern, tvg_name)
-
-    if match:
-        return match.group(1).strip()  # Return show name before markers
-    return tvg_name.strip()            # Return cleaned name if no markers found
+    return get_naming_rules().show_name(tvg_name)
 
 def list_unique_titles():
     """
@@ -149,40 +672,13 @@ def list_unique_titles():
     """
     input_file_path = 'data-filtered.m3u'
 
-    # Set to store unique titles
-    unique_titles = set()
-
-    # Read and process the filtered M3U file
-    try:
-        with open(input_file_path, 'r') as file:
-            m3u_content = file.read()
-    except FileNotFoundError:
+    if not os.path.exists(input_file_path):
         print(f"Error: File '{input_file_path}' not found.")
         return []
 
-    # Split the M3U content into lines
-    lines = m3u_content.strip().split("\n")
-
-    # Loop through lines to extract titles
-    for i in range(len(lines)):
-        if lines[i].startswith("#EXTINF"):
-            # Extract tvg-name using regex
-            tvg_name_match = re.search(r'tvg-name="([^"]*)"', lines[i])
-            if not tvg_name_match:
-                # print(f"No tvg-name found in line: {lines[i]}")
-                continue
-
-            tvg_name = tvg_name_match.group(1)
-            # print(f"Found tvg_name: {tvg_name}")
-
-            # Get the cleaned show name and add to the set
-            show_name = get_show_name(tvg_name)
-            unique_titles.add(show_name)
-
-    # Print the list of unique titles to the console
-    # print("Unique Titles:")
-    # for title in sorted(unique_titles):
-    #     print(title)
+    # Stream the filtered M3U file and classify each distinct tvg_name once
+    classifications = get_naming_rules().classify_all(entry['tvg_name'] for entry in iter_entries(input_file_path))
+    unique_titles = {classification.show for classification in classifications.values()}
 
     return sorted(unique_titles)
 
@@ -233,117 +729,662 @@ def clear_library_directory():
 
     print(f"Cleared all contents from the '{library_dir}' directory.")
 
-def create_folders_and_strm_files(entries, library_path="VOD Files"):
+def remove_path(path):
+    """Remove a file or a directory tree, if it exists."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+def exchange_paths(first_path, second_path):
+    """
+    Atomically exchange two existing paths, with renameat2(RENAME_EXCHANGE) on Linux or
+    renamex_np(RENAME_SWAP) on macOS.
+
+    :return: True if the paths were exchanged, False if the system or filesystem cannot.
+    """
+    import ctypes
+    import sys
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        first, second = os.fsencode(first_path), os.fsencode(second_path)
+        if sys.platform.startswith("linux"):
+            # renameat2(AT_FDCWD, first, AT_FDCWD, second, RENAME_EXCHANGE)
+            result = libc.renameat2(-100, first, -100, second, 2)
+        elif sys.platform == "darwin":
+            result = libc.renamex_np(first, second, 2)  # RENAME_SWAP
+        else:
+            return False
+    except (AttributeError, OSError):
+        return False  # The C library has no such function
+    return result == 0
+
+def swap_in(staging_path, target_path):
+    """
+    Put a completely built library directory in place of the current one.
+
+    Where the system supports it, the staging directory and the library are exchanged
+    atomically, so readers always find a complete library at `target_path`. Otherwise the
+    library is renamed away and the staging directory renamed in its place, which leaves
+    `target_path` missing for the instant between the two renames. Either way the old
+    library ends up as `target_path + PREVIOUS_SUFFIX`, replacing the previous one.
+
+    :param staging_path: The new library directory.
+    :param target_path: The library directory to replace.
+    """
+    previous_path = target_path + PREVIOUS_SUFFIX
+    if os.path.lexists(target_path) and exchange_paths(staging_path, target_path):
+        # The staging path now holds the old library
+        remove_path(previous_path)
+        os.rename(staging_path, previous_path)
+        return
+
+    if os.path.lexists(target_path):
+        remove_path(previous_path)
+        os.rename(target_path, previous_path)
+    os.rename(staging_path, target_path)
+
+def replace_keeping_previous(temp_path, target_path):
+    """
+    Atomically replace a file with a new one, keeping the old one as `target_path + PREVIOUS_SUFFIX`.
+
+    :param temp_path: The new file, in the same directory as the target.
+    :param target_path: The file to replace.
+    """
+    if os.path.exists(target_path):
+        previous_path = target_path + PREVIOUS_SUFFIX
+        remove_path(previous_path)
+        try:
+            # A second name for the old file, so the target never goes missing
+            os.link(target_path, previous_path)
+        except OSError:
+            shutil.copy2(target_path, previous_path)
+    os.replace(temp_path, target_path)
+
+def rollback_library(target_path="VOD Files"):
+    """
+    Swap a library directory or zip file with the one it replaced.
+
+    Rolling back twice restores the newer library.
+
+    :param target_path: The library directory or zip file.
+    """
+    target_path = os.path.normpath(target_path)
+    previous_path = target_path + PREVIOUS_SUFFIX
+    if not os.path.lexists(previous_path):
+        raise FileNotFoundError(f"There is no previous version of '{target_path}' to roll back to.")
+
+    if os.path.lexists(target_path) and exchange_paths(previous_path, target_path):
+        print(f"Rolled '{target_path}' back to its previous version.")
+        return
+
+    temp_path = target_path + STAGING_SUFFIX
+    remove_path(temp_path)
+    if os.path.lexists(target_path):
+        os.rename(target_path, temp_path)
+    os.rename(previous_path, target_path)
+    if os.path.lexists(temp_path):
+        os.rename(temp_path, previous_path)
+    print(f"Rolled '{target_path}' back to its previous version.")
+
+def link_unchanged(previous_path, path, content):
+    """
+    Hard-link a file of the previous library into the new one if its content is the same.
+
+    :param previous_path: The file in the previous library.
+    :param path: The file to create in the new library.
+    :param content: The text the new file should hold.
+    :return: True if the file was linked, False if it must be written.
+    """
+    try:
+        if os.stat(previous_path).st_size != len(content.encode('utf-8')):
+            return False
+        with open(previous_path, "r") as file:
+            if file.read() != content:
+                return False
+        os.link(previous_path, path)
+        return True
+    except (OSError, UnicodeDecodeError):
+        return False
+
+def write_strm_files(files, library_path="VOD Files", max_workers=DEFAULT_WRITE_WORKERS, link_from=None):
+    """
+    Write .strm files below the library directory on a thread pool.
+
+    Each directory is created once, tracked in an in-memory set, and file writes are
+    handed to a pool so that syscall latency on network-mounted disks overlaps. The
+    number of queued writes is bounded, so `files` may be a lazy iterable.
+
+    :param files: Iterable of (relative_path, url) tuples. Paths must be unique, since two
+                  threads writing the same file would interleave their content.
+    :param library_path: Path to the Library directory.
+    :param max_workers: Number of writer threads.
+    :param link_from: Previous library directory. Files it holds with the same content are
+                      hard-linked instead of written; `library_path` must then be a new,
+                      empty directory on the same filesystem.
+    :return: A dictionary with the 'written', 'linked', 'failed' and 'bytes_written' counts and
+             the list of 'failures' as (relative_path, error message) tuples.
+    """
+    summary = {"written": 0, "linked": 0, "failed": 0, "bytes_written": 0, "failures": []}
+    lock = threading.Lock()
+    pending = threading.BoundedSemaphore(max_workers * 64)
+    created_dirs = set()
+
+    def write(relative_path, url):
+        path = os.path.join(library_path, relative_path)
+        try:
+            if link_from is not None and link_unchanged(os.path.join(link_from, relative_path), path, url):
+                with lock:
+                    summary["linked"] += 1
+                return
+            # Never write through a file that may be shared with another library by a hard
+            # link: any existing file in a staged build, and linked files otherwise
+            try:
+                if link_from is not None or os.stat(path).st_nlink > 1:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            with open(path, "w") as strm_file:
+                strm_file.write(url)
+            with lock:
+                summary["written"] += 1
+                summary["bytes_written"] += len(url)
+        except Exception as e:
+            with lock:
+                summary["failed"] += 1
+                summary["failures"].append((relative_path, str(e)))
+        finally:
+            pending.release()
+
+    from concurrent.futures.thread import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for relative_path, url in files:
+            folder = os.path.dirname(os.path.join(library_path, relative_path))
+            if folder not in created_dirs:
+                try:
+                    os.makedirs(folder, exist_ok=True)
+                except Exception as e:
+                    with lock:
+                        summary["failed"] += 1
+                        summary["failures"].append((relative_path, str(e)))
+                    continue
+                created_dirs.add(folder)
+
+            pending.acquire()
+            executor.submit(write, relative_path, url)
+
+    return summary
+
+def create_folders_and_strm_files(entries, library_path="VOD Files", max_workers=DEFAULT_WRITE_WORKERS, staged=True):
     """
     Create folders based on the show name (from get_show_name) and place a .strm file
     within each folder. The .strm file's name is derived from the `tvg_name`.
 
-    :param entries: List of dictionaries containing 'tvg_name' and 'url'.
+    By default the library is built in a staging directory next to it, reusing unchanged
+    files and show artwork of the current library through hard links, and then swapped in.
+    Media servers never see a partial library, and the replaced one is kept as
+    `library_path + PREVIOUS_SUFFIX` for `rollback_library`.
+
+    :param entries: Iterable of dictionaries containing 'tvg_name' and 'url'.
     :param library_path: Path to the Library directory.
+    :param max_workers: Number of writer threads.
+    :param staged: Build in a staging directory and swap it in. Otherwise write into the
+                   library directory in place.
+    :return: A dictionary with the number of files 'written', 'linked', 'skipped' and
+             'failed', the 'bytes_written' and the list of 'failures'.
     """
-    # Ensure the Library directory exists
-    os.makedirs(library_path, exist_ok=True)
+    target_path = os.path.normpath(library_path)
+    if staged:
+        # Start from an empty staging directory; one may be left over by an interrupted run
+        build_path = target_path + STAGING_SUFFIX
+        remove_path(build_path)
+        os.makedirs(build_path)
+        link_from = target_path if os.path.isdir(target_path) else None
+    else:
+        # Ensure the Library directory exists
+        os.makedirs(target_path, exist_ok=True)
+        build_path = target_path
+        link_from = None
+
+    skipped = 0
+    show_names = set()
+    relative_paths = set()
+    # Manifest of the staged library, so a later sync only writes what changed
+    manifest = {}
+    show_name_of = get_naming_rules().show_name
+
+    def iter_files():
+        nonlocal skipped
+        for entry in entries:
+            tvg_name = entry.get('tvg_name', '')
+            url = entry.get('url', '')
 
-    for entry in entries:
-        tvg_name = entry.get('tvg_name', '')
-        url = entry.get('url', '')
+            if not tvg_name or not url:
+                skipped += 1
+                continue
 
-        if not tvg_name or not url:
-            print(f"Skipping entry due to missing tvg_name or url: {entry}")
-            continue
+            # The .strm file is named after the original tvg_name, inside the show folder
+            show_name = show_name_of(tvg_name)
+            relative_path = os.path.join(show_name, f"{tvg_name}.strm")
 
-        # Generate the show name using get_show_name
-        show_name = get_show_name(tvg_name)
+            # Duplicate names keep the first entry, as the sync and zip writers do, so no
+            # two writer threads ever open the same file
+            if relative_path in relative_paths:
+                skipped += 1
+                continue
+            relative_paths.add(relative_path)
+            show_names.add(show_name)
+            if staged:
+                manifest[relative_path] = url_hash(url)
+            yield relative_path, url
 
-        # Create a folder for the show
-        show_folder = os.path.join(library_path, show_name)
-        os.makedirs(show_folder, exist_ok=True)
+    try:
+        summary = write_strm_files(iter_files(), build_path, max_workers, link_from)
+    except BaseException:
+        if staged:
+            remove_path(build_path)
+        raise
+    summary["skipped"] = skipped
+
+    if staged:
+        # Keep the artwork of the shows still in the library
+        if link_from is not None:
+            for show_name in show_names:
+                for artwork_file in ARTWORK_FILES:
+                    try:
+                        os.link(os.path.join(link_from, show_name, artwork_file),
+                                os.path.join(build_path, show_name, artwork_file))
+                    except OSError:
+                        pass
+        for relative_path, _ in summary["failures"]:
+            manifest.pop(relative_path, None)
+        save_library_manifest(manifest, build_path)
+        swap_in(build_path, target_path)
+
+    print(f"Library written to '{library_path}': {summary['written']} written, {summary['linked']} unchanged, "
+          f"{summary['skipped']} skipped, {summary['failed']} failed.")
+    for relative_path, error in summary["failures"]:
+        print(f"Failed to create .strm file {relative_path}: {error}")
+    return summary
+
+def url_hash(url):
+    """
+    Hash a stream URL for change detection.
 
-        # Create the .strm file inside the folder with the original tvg_name as the filename
-        filename = os.path.join(show_folder, f"{tvg_name}.strm")
+    :param url: The URL written into a .strm file.
+    :return: A short hexadecimal digest of the URL.
+    """
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
 
-        try:
-            # Write the URL to the .strm file
-            with open(filename, "w") as strm_file:
-                strm_file.write(url)
+def load_library_manifest(library_path="VOD Files"):
+    """
+    Load the manifest of a library directory.
 
-            # print(f"Created .strm file: {filename}")
-        except Exception as e:
-            print(f"Failed to create .strm file for {show_name}: {e}")
+    :param library_path: Path to the Library directory.
+    :return: A dictionary mapping relative .strm paths to URL hashes. Empty if there is no manifest.
+    """
+    manifest_path = os.path.join(library_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_library_manifest(manifest, library_path="VOD Files"):
+    """
+    Atomically write the manifest of a library directory.
+
+    :param manifest: A dictionary mapping relative .strm paths to URL hashes.
+    :param library_path: Path to the Library directory.
+    """
+    manifest_path = os.path.join(library_path, MANIFEST_FILE)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, manifest_path)
+
+def sync_folders_and_strm_files(entries, library_path="VOD Files", max_workers=DEFAULT_WRITE_WORKERS):
+    """
+    Bring the library directory in line with the given entries without rewriting it.
+
+    Only new or changed .strm files are written and only files whose entries left the
+    playlist are deleted, so unchanged files keep their mtimes and media servers do
+    not rescan them. The state of the library is tracked in MANIFEST_FILE.
+
+    :param entries: Iterable of dictionaries containing 'tvg_name' and 'url'.
+    :param library_path: Path to the Library directory.
+    :param max_workers: Number of writer threads.
+    :return: A dictionary with the number of files 'written', 'unchanged', 'removed', 'skipped'
+             and 'failed', and the 'bytes_written'.
+    """
+    os.makedirs(library_path, exist_ok=True)
+
+    previous_manifest = load_library_manifest(library_path)
+    manifest = {}
+    summary = {"written": 0, "unchanged": 0, "removed": 0, "skipped": 0, "failed": 0, "bytes_written": 0}
+    show_name_of = get_naming_rules().show_name
 
-def write_files_to_nas(entries, nas_directory):
+    def iter_changed_files():
+        for entry in entries:
+            tvg_name = entry.get('tvg_name', '')
+            url = entry.get('url', '')
+
+            if not tvg_name or not url:
+                summary["skipped"] += 1
+                continue
+
+            relative_path = os.path.join(show_name_of(tvg_name), f"{tvg_name}.strm")
+            digest = url_hash(url)
+
+            # Duplicate names keep the first entry so repeated runs stay stable
+            if relative_path in manifest:
+                summary["skipped"] += 1
+                continue
+
+            manifest[relative_path] = digest
+            if previous_manifest.get(relative_path) == digest:
+                summary["unchanged"] += 1
+                continue
+
+            yield relative_path, url
+
+    result = write_strm_files(iter_changed_files(), library_path, max_workers)
+    summary["written"] = result["written"]
+    summary["failed"] = result["failed"]
+    summary["bytes_written"] = result["bytes_written"]
+    for relative_path, error in result["failures"]:
+        # Record the previous state, if any, so the next run retries the file
+        if relative_path in previous_manifest:
+            manifest[relative_path] = previous_manifest[relative_path]
+        else:
+            manifest.pop(relative_path, None)
+        print(f"Failed to create .strm file {relative_path}: {error}")
+
+    # Remove the files whose entries are gone, and their folders once empty
+    for relative_path in previous_manifest.keys() - manifest.keys():
+        filename = os.path.join(library_path, relative_path)
+        try:
+            os.remove(filename)
+            summary["removed"] += 1
+        except FileNotFoundError:
+            pass
+
+        folder = os.path.dirname(filename)
+        while folder and os.path.abspath(folder) != os.path.abspath(library_path):
+            # Artwork alone does not keep a show folder alive
+            if os.path.isdir(folder) and set(os.listdir(folder)) <= set(ARTWORK_FILES):
+                for artwork_file in os.listdir(folder):
+                    os.remove(os.path.join(folder, artwork_file))
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    save_library_manifest(manifest, library_path)
+    print(f"Library synced: {summary['written']} written, {summary['unchanged']} unchanged, "
+          f"{summary['removed']} removed, {summary['skipped']} skipped, {summary['failed']} failed.")
+    return summary
+
+def write_files_to_nas(entries, nas_directory, config=None, pool_size=None, connection_factory=None,
+                       verify_content=True):
     """
     Write .strm files to a NAS directory using pysmb.
 
-    :param entries: List of dictionaries containing 'tvg_name' and 'url'.
+    Show folders are written in parallel over a bounded pool of SMB connections, and
+    files whose content is already up to date are left untouched.
+
+    :param entries: Iterable of dictionaries containing 'tvg_name' and 'url'.
     :param nas_directory: The path to the folder on the NAS.
+    :param config: NAS connection settings. Defaults to the contents of nas.NAS_CONFIG_FILE.
+    :param pool_size: Number of parallel SMB connections.
+    :param connection_factory: Callable returning a connected SMB connection. Defaults to
+                               `nas.connect_to_nas` with `config`.
+    :param verify_content: Read back same-sized files to confirm they are unchanged.
+    :return: A dictionary with the number of files 'written', 'unchanged', 'skipped' and 'failed',
+             the 'bytes_written' and the list of 'failures'.
     """
-    # Establish a connection
-    conn = connect_to_nas()
+    import nas
 
+    config = config or nas.load_nas_config()
+    connection_factory = connection_factory or (lambda: nas.connect_to_nas(config))
+    pool = nas.SMBConnectionPool(connection_factory, pool_size or nas.DEFAULT_POOL_SIZE)
+
+    # Group the files by show folder so each folder is listed and created once
+    folders = {}
+    seen = set()
+    skipped = 0
+    show_name_of = get_naming_rules().show_name
     for entry in entries:
         tvg_name = entry.get('tvg_name', '')
         url = entry.get('url', '')
 
         if not tvg_name or not url:
-            print(f"Skipping entry due to missing tvg_name or url: {entry}")
+            skipped += 1
             continue
 
-        # Get show name and prepare folder/file names
-        show_name = get_show_name(tvg_name)
-        folder_name = os.path.join(nas_directory, show_name)
+        show_name = show_name_of(tvg_name)
         file_name = f"{tvg_name}.strm"
 
-        try:
-            # Ensure the directory exists
-            conn.createDirectory(NAS_SHARE, folder_name)
+        # Duplicate names keep the first entry, as the other writers do
+        if (show_name, file_name) in seen:
+            skipped += 1
+            continue
+        seen.add((show_name, file_name))
+        folders.setdefault(show_name, []).append((file_name, url.encode('utf-8')))
 
-            # Write the file content
-            file_path = os.path.join(folder_name, file_name)
-            with conn.openFile(NAS_SHARE, file_path, 'w') as file:
-                file.write(url.encode('utf-8'))
+    try:
+        summary = nas.write_folders(folders, nas_directory, config.get("share"), pool, verify_content)
+    finally:
+        # Close the connections
+        pool.close()
+    summary["skipped"] = skipped
+
+    print(f"NAS library written to '{nas_directory}': {summary['written']} written, "
+          f"{summary['unchanged']} unchanged, {summary['skipped']} skipped, {summary['failed']} failed.")
+    for path, error in summary["failures"]:
+        print(f"Failed to write .strm files in {path}: {error}")
+    return summary
+
+def write_zip_archive(zip_file_path, members, compression=None, compresslevel=None, update=False,
+                      previous_path=None):
+    """
+    Write a zip archive of .strm files, replacing any previous archive atomically.
+
+    In update mode the central directory of the previous archive is compared with the
+    new members by name and CRC: an identical archive is left untouched, an archive that
+    only gains members is copied and appended to, and anything else is rebuilt. The
+    replaced archive is kept as `zip_file_path + PREVIOUS_SUFFIX`.
+
+    :param zip_file_path: Path to the zip file to create or update.
+    :param members: Dictionary mapping member names to their text content.
+    :param compression: The zipfile compression method, e.g. zipfile.ZIP_DEFLATED. Defaults to ZIP_STORED.
+    :param compresslevel: The compression level, or None for the method's default.
+    :param update: Reuse the previous archive when possible instead of rebuilding it.
+    :param previous_path: The previous archive, when it is not at `zip_file_path` (e.g. when
+                          building into a staging directory). An unchanged one is hard-linked.
+    :return: A dictionary with the number of members 'written' and 'reused', and the 'mode'
+             used ('unchanged', 'append' or 'rebuild').
+    """
+    import zipfile
 
-            print(f"Created .strm file on NAS: {file_path}")
-        except Exception as e:
-            print(f"Failed to create .strm file for {show_name}: {e}")
+    if compression is None:
+        compression = zipfile.ZIP_STORED
+    encoded = {name: content.encode('utf-8') for name, content in members.items()}
 
-    # Close the connection
-    conn.close()
+    previous_path = previous_path or zip_file_path
+    # Build next to the target and swap it in, so a failed run keeps the old archive
+    temp_path = zip_file_path + ".tmp"
 
-def create_folders_and_strm_files_in_zip(entries, zip_file_path="VOD.zip"):
+    if update and os.path.exists(previous_path):
+        try:
+            with zipfile.ZipFile(previous_path, 'r') as previous:
+                existing = {info.filename: info for info in previous.infolist()}
+        except zipfile.BadZipFile:
+            existing = {}
+
+        same_method = all(info.compress_type == compression for info in existing.values())
+        changed = [
+            name for name, info in existing.items()
+            if name not in encoded or info.CRC != zlib.crc32(encoded[name]) or info.file_size != len(encoded[name])
+        ]
+        if existing and same_method and not changed:
+            added = [name for name in encoded if name not in existing]
+            if not added:
+                if previous_path != zip_file_path:
+                    try:
+                        os.link(previous_path, zip_file_path)
+                    except OSError:
+                        shutil.copy2(previous_path, zip_file_path)
+                return {"written": 0, "reused": len(existing), "mode": "unchanged"}
+
+            # Append to a copy, so readers of the current archive never see it half-written
+            shutil.copyfile(previous_path, temp_path)
+            with zipfile.ZipFile(temp_path, 'a', compression=compression, compresslevel=compresslevel) as zipf:
+                for name in added:
+                    zipf.writestr(name, encoded[name])
+            replace_keeping_previous(temp_path, zip_file_path)
+            return {"written": len(added), "reused": len(existing), "mode": "append"}
+
+    with zipfile.ZipFile(temp_path, 'w', compression=compression, compresslevel=compresslevel) as zipf:
+        for name, data in encoded.items():
+            zipf.writestr(name, data)
+    replace_keeping_previous(temp_path, zip_file_path)
+    return {"written": len(encoded), "reused": 0, "mode": "rebuild"}
+
+def archive_names(group_titles):
+    """
+    Give each group a distinct archive name.
+
+    Names are the group titles without special characters, "Ungrouped" for entries without
+    a group. When several groups end up with the same name (compared case-insensitively),
+    one group whose title already is that name keeps it, and the others get a short hash
+    of their title appended, so the name of a group does not depend on the order of the playlist.
+
+    :param group_titles: Iterable of distinct group titles; "" for entries without a group.
+    :return: A dictionary mapping each group title to its archive name, without extension.
+    """
+    by_name = {}
+    for group_title in group_titles:
+        # Sanitize the archive name to avoid issues with invalid characters
+        name = "".join(c for c in group_title if c.isalnum() or c in " _-").strip() or "Ungrouped"
+        by_name.setdefault(name.lower(), []).append((name, group_title))
+
+    names = {}
+    for candidates in by_name.values():
+        if len(candidates) == 1:
+            name, group_title = candidates[0]
+            names[group_title] = name
+            continue
+        plain = min((group_title for name, group_title in candidates if group_title == name), default=None)
+        for name, group_title in candidates:
+            if group_title == plain:
+                names[group_title] = name
+            else:
+                digest = hashlib.sha1(group_title.encode('utf-8')).hexdigest()[:8]
+                names[group_title] = f"{name} {digest}"
+    return names
+
+def create_folders_and_strm_files_in_zip(entries, zip_file_path="VOD.zip", compression=None,
+                                         compresslevel=None, update=False, split_by_group=False, max_workers=None):
     """
     Create a zip file containing folders (as logical structure) based on the show name (from get_show_name),
     and place a .strm file within each folder. The .strm file's name is derived from the `tvg_name`.
 
-    :param entries: List of dictionaries containing 'tvg_name' and 'url'.
+    With `split_by_group`, one archive per group-title is written instead, into a directory
+    named after `zip_file_path` without its extension, and the archives are built in
+    parallel worker processes. That directory is built in a staging directory and swapped
+    in like the library directory, so archives of groups that are gone are dropped too.
+
+    :param entries: Iterable of dictionaries containing 'tvg_name' and 'url'.
     :param zip_file_path: Path to the zip file to create or modify.
+    :param compression: The zipfile compression method, e.g. zipfile.ZIP_DEFLATED. Defaults to ZIP_STORED.
+    :param compresslevel: The compression level, or None for the method's default.
+    :param update: Reuse the previous archive(s) when the content has not changed.
+    :param split_by_group: Write one archive per group-title.
+    :param max_workers: Number of worker processes used with `split_by_group`.
+    :return: A dictionary with the number of members 'written', 'reused' and 'skipped', the
+             number of 'archives' written and the 'bytes_written'.
     """
-    with zipfile.ZipFile(zip_file_path, 'w') as zipf:
-        for entry in entries:
-            tvg_name = entry.get('tvg_name', '')
-            url = entry.get('url', '')
-
-            if not tvg_name or not url:
-                print(f"Skipping entry due to missing tvg_name or url: {entry}")
-                continue
-
-            # Generate the show name using get_show_name
-            show_name = get_show_name(tvg_name)
+    # Collect the members per archive; duplicate names keep the first entry
+    archives = {}
+    skipped = 0
+    show_name_of = get_naming_rules().show_name
+    for entry in entries:
+        tvg_name = entry.get('tvg_name', '')
+        url = entry.get('url', '')
 
-            # Define the logical folder path inside the zip file
-            show_folder = f"{show_name}/"
+        if not tvg_name or not url:
+            skipped += 1
+            continue
 
-            # Define the file path within the zip
-            file_name = f"{show_folder}{tvg_name}.strm"
+        # Define the file path within the zip, inside the logical show folder
+        file_name = f"{show_name_of(tvg_name)}/{tvg_name}.strm"
 
+        archive_key = (entry.get('group_title') or "") if split_by_group else None
+        members = archives.setdefault(archive_key, {})
+        if file_name in members:
+            skipped += 1
+            continue
+        members[file_name] = url
+
+    summary = {"written": 0, "reused": 0, "skipped": skipped, "archives": 0, "bytes_written": 0}
+
+    if not split_by_group:
+        result = write_zip_archive(zip_file_path, archives.get(None, {}), compression, compresslevel, update)
+        summary["written"] += result["written"]
+        summary["reused"] += result["reused"]
+        summary["archives"] = 1
+        if result["mode"] != "unchanged":
+            summary["bytes_written"] = os.path.getsize(zip_file_path)
+        print(f"Zip file {zip_file_path} ({result['mode']}): {summary['written']} written, "
+              f"{summary['reused']} reused, {summary['skipped']} skipped.")
+        return summary
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    output_dir = os.path.normpath(os.path.splitext(zip_file_path)[0])
+    staging_dir = output_dir + STAGING_SUFFIX
+    remove_path(staging_dir)
+    os.makedirs(staging_dir)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        names = archive_names(archives)
+        for group_title, members in archives.items():
+            archive_name = names[group_title]
+            archive_path = os.path.join(staging_dir, f"{archive_name}.zip")
+            previous_path = os.path.join(output_dir, f"{archive_name}.zip")
+            futures[executor.submit(write_zip_archive, archive_path, members, compression, compresslevel, update,
+                                    previous_path)] = archive_path
+
+        failed = False
+        for future, archive_path in futures.items():
             try:
-                # Write the URL as the content of the .strm file in the zip
-                zipf.writestr(file_name, url)
-                print(f"Added .strm file to zip: {file_name}")
+                result = future.result()
             except Exception as e:
-                print(f"Failed to add .strm file for {show_name}: {e}")
-
-    print(f"All files have been added to the zip file: {zip_file_path}")
+                print(f"Failed to write zip file {archive_path}: {e}")
+                failed = True
+                continue
+            summary["written"] += result["written"]
+            summary["reused"] += result["reused"]
+            summary["archives"] += 1
+            if result["mode"] != "unchanged":
+                summary["bytes_written"] += os.path.getsize(archive_path)
+
+    # Keep the current archives rather than swap in an incomplete set
+    if failed:
+        remove_path(staging_dir)
+        raise RuntimeError(f"Some zip files could not be written; {output_dir} was left unchanged.")
+    swap_in(staging_dir, output_dir)
+
+    print(f"Wrote {summary['archives']} zip files to {output_dir}: {summary['written']} written, "
+          f"{summary['reused']} reused, {summary['skipped']} skipped.")
+    return summary
 
 # nas_library_path = "/volumeUSB1/usbshare/VOD Files"  # Folder on the NAS
 
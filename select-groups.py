@@ -1,30 +1,59 @@
 import tkinter as tk
 from tkinter import messagebox
+import fnmatch
 import json
 import os
 import process
+from group_rules import parse_selection
 
 # File to store the selected groups
 CONFIG_FILE = "selected_groups.json"
 
-def load_config():
-    """Load the stored group selections from a file."""
+def load_raw_config():
+    """Load the stored selection file as is: a list of groups, or a dictionary with rules."""
     if os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, "r") as file:
             return json.load(file)
     return []
 
+def load_config():
+    """Load the stored group selections from a file."""
+    return parse_selection(load_raw_config())["groups"]
+
 def save_config(selected_groups):
-    """Save the selected groups to a file."""
+    """Save the selected groups to a file, keeping any include/exclude rules it holds."""
+    config = load_raw_config()
+    if isinstance(config, dict):
+        config["groups"] = selected_groups
+    else:
+        config = selected_groups
     with open(CONFIG_FILE, "w") as file:
-        json.dump(selected_groups, file)
+        json.dump(config, file)
 
 def on_save():
     """Handle saving the selected groups."""
-    selected_groups = [group for group, var in check_vars.items() if var.get()]
-    save_config(selected_groups)
+    save_config(sorted(selected_groups))
     messagebox.showinfo("Success", "Selected groups have been saved!")
 
+def is_pattern(text):
+    """Tell whether a search text is a glob pattern rather than a plain substring."""
+    return any(c in text for c in "*?[")
+
+def filter_groups(groups, query):
+    """
+    Filter group titles by a case-insensitive substring or glob pattern.
+
+    :param groups: The group titles to filter, in display order.
+    :param query: A substring, or a glob pattern such as 'EN | *'.
+    :return: The matching group titles, in the same order.
+    """
+    query = query.strip().lower()
+    if not query:
+        return list(groups)
+    if is_pattern(query):
+        return [group for group in groups if fnmatch.fnmatchcase(group.lower(), query)]
+    return [group for group in groups if query in group.lower()]
+
 def create_ui(unique_groups):
     """Create the UI for selecting groups."""
     root = tk.Tk()
@@ -48,7 +77,10 @@ def create_ui(unique_groups):
     # Explanation Text
     explanation_label = tk.Label(
         root,
-        text="Select the groups you want to track and save your preferences.",
+        text=(
+            "Select the groups you want to track and save your preferences. "
+            "Type to filter (plain text or a pattern like 'EN | *'), click a group to toggle it."
+        ),
         font=("Arial", 12),
         bg="#f5f5f5",
         fg="#333333",
@@ -58,43 +90,125 @@ def create_ui(unique_groups):
     )
     explanation_label.pack()
 
-    # Frame for Canvas and Scrollbar
+    # Search box and bulk selection buttons
+    search_frame = tk.Frame(root, bg="#f5f5f5")
+    search_frame.pack(fill="x", padx=10)
+
+    search_var = tk.StringVar()
+    search_entry = tk.Entry(search_frame, textvariable=search_var, font=("Arial", 11))
+    search_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
+
+    status_label = tk.Label(root, text="", font=("Arial", 10), bg="#f5f5f5", fg="#333333", anchor="w")
+
+    # Frame for the List and Scrollbar
     frame = tk.Frame(root, bg="#f5f5f5", pady=10)
-    frame.pack(fill="both", expand=True, padx=10)
 
-    # Canvas for Scrollable Content
-    canvas = tk.Canvas(frame, bg="#f5f5f5", highlightthickness=0)
-    canvas.pack(side="left", fill="both", expand=True)
+    # A Listbox only draws the rows that are visible, so it stays fast with tens of thousands of groups
+    listbox = tk.Listbox(
+        frame,
+        font=("Arial", 10),
+        bg="#f5f5f5",
+        fg="#333333",
+        activestyle="none",
+        selectmode="browse",
+        highlightthickness=0,
+        exportselection=False
+    )
+    scrollbar = tk.Scrollbar(frame, orient="vertical", command=listbox.yview, bg="#f5f5f5")
+    listbox.configure(yscrollcommand=scrollbar.set)
 
-    scrollbar = tk.Scrollbar(frame, orient="vertical", command=canvas.yview, bg="#f5f5f5")
-    scrollbar.pack(side="right", fill="y")
-    canvas.configure(yscrollcommand=scrollbar.set)
-
-    # Frame Inside Canvas
-    checkbox_frame = tk.Frame(canvas, bg="#f5f5f5")
-    canvas.create_window((0, 0), window=checkbox_frame, anchor="nw")
-
-    # Create Checkboxes for Each Group
-    for group in unique_groups:
-        var = tk.BooleanVar(value=group in initial_selected_groups)
-        check_vars[group] = var
-        checkbox = tk.Checkbutton(
-            checkbox_frame,
-            text=group,
-            variable=var,
-            font=("Arial", 10),
-            bg="#f5f5f5",
-            fg="#333333",
-            anchor="w",
-            padx=5
-        )
-        checkbox.pack(fill="x", padx=10, pady=2)
+    # State of the current view
+    view = {"query": "", "groups": list(unique_groups), "pending": None}
 
-    # Update Scroll Region
-    def update_scroll_region(event):
-        canvas.configure(scrollregion=canvas.bbox("all"))
+    def row_text(group):
+        return ("\u2611 " if group in selected_groups else "\u2610 ") + group
 
-    checkbox_frame.bind("<Configure>", update_scroll_region)
+    def update_status():
+        status_label.config(
+            text=f"{len(view['groups']):,} of {len(unique_groups):,} groups shown, {len(selected_groups):,} selected"
+        )
+
+    def refresh_list():
+        listbox.delete(0, "end")
+        if view["groups"]:
+            listbox.insert("end", *(row_text(group) for group in view["groups"]))
+        update_status()
+
+    def apply_filter():
+        view["pending"] = None
+        query = search_var.get()
+        previous = view["query"].strip().lower()
+        current = query.strip().lower()
+        # A longer substring query can only narrow the previous results
+        if previous and current.startswith(previous) and not is_pattern(current):
+            source = view["groups"]
+        else:
+            source = unique_groups
+        view["query"] = query
+        view["groups"] = filter_groups(source, query)
+        refresh_list()
+
+    def on_search_change(*_):
+        # Debounce typing so the list is only rebuilt once the user pauses
+        if view["pending"] is not None:
+            root.after_cancel(view["pending"])
+        view["pending"] = root.after(150, apply_filter)
+
+    def toggle(index):
+        if not 0 <= index < len(view["groups"]):
+            return
+        group = view["groups"][index]
+        if group in selected_groups:
+            selected_groups.discard(group)
+        else:
+            selected_groups.add(group)
+        listbox.delete(index)
+        listbox.insert(index, row_text(group))
+        listbox.activate(index)
+        update_status()
+
+    def on_click(event):
+        index = listbox.nearest(event.y)
+        bbox = listbox.bbox(index)
+        if bbox and bbox[1] <= event.y <= bbox[1] + bbox[3]:
+            toggle(index)
+        return "break"
+
+    def on_space(_):
+        toggle(listbox.index("active"))
+        return "break"
+
+    def select_shown(selected):
+        if selected:
+            selected_groups.update(view["groups"])
+        else:
+            selected_groups.difference_update(view["groups"])
+        top = listbox.yview()[0]
+        refresh_list()
+        listbox.yview_moveto(top)
+
+    search_var.trace_add("write", on_search_change)
+    listbox.bind("<Button-1>", on_click)
+    listbox.bind("<space>", on_space)
+
+    for text, selected in (("Select shown", True), ("Deselect shown", False)):
+        tk.Button(
+            search_frame,
+            text=text,
+            command=lambda selected=selected: select_shown(selected),
+            bg="#003366",
+            fg="white",
+            font=("Arial", 10, "bold"),
+            activebackground="#002244",
+            activeforeground="white"
+        ).pack(side="left", padx=2)
+
+    status_label.pack(fill="x", padx=10, pady=(5, 0))
+    frame.pack(fill="both", expand=True, padx=10)
+    listbox.pack(side="left", fill="both", expand=True)
+    scrollbar.pack(side="right", fill="y")
+    refresh_list()
+    search_entry.focus_set()
 
     # Save Button
     save_button = tk.Button(
@@ -126,19 +240,12 @@ def create_ui(unique_groups):
 
     root.mainloop()
 
-
 # Generate Data and Launch the UI
-result = process.makeobject('data.m3u')
-result = process.get_unique_group_titles(result)
+result = process.get_group_titles_from_index('data.m3u')
 result = sorted(title.strip() for title in result)
 
-entries = [{'group_title': title} for title in result]
-
-# Load the initially selected groups
-initial_selected_groups = load_config()
-
-# Dictionary to hold the checkbutton variables
-check_vars = {}
+# Load the initially selected groups; the UI updates this set as groups are toggled
+selected_groups = set(load_config())
 
 # Launch the UI
 create_ui(result)
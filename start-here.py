@@ -1,63 +1,122 @@
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk  # Use ttk for consistent button styling
-import os
+import queue
 import requests
 import subprocess  # For running another Python script
-from process import filterm3u, makeobject, create_folders_and_strm_files_in_zip
+from process import iter_matching_entries, create_folders_and_strm_files_in_zip
+from fetch import download_sources, load_urls, save_urls
+from metrics import stage_report, add_counters
+from tasks import BackgroundTask, drain_events
 
-# Local files to store the URL and fetched data
-CONFIG_FILE = "url_config.txt"
+# Local file to store the fetched data
 DATA_FILE = "data_file.txt"
 
-def load_url():
-    """Load the stored URL from the local file."""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return file.read().strip()
-    return ""
+# How often (in milliseconds) the UI polls the background tasks for progress
+POLL_INTERVAL = 100
 
-def save_url(url):
-    """Save the URL to a local file."""
-    with open(CONFIG_FILE, "w") as file:
-        file.write(url)
+# Events reported by the background tasks, and the tasks currently running by name
+task_events = queue.Queue()
+running_tasks = {}
 
-def fetch_and_store_data(url):
-    """Fetch content from the URL and store it to a local data file."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+def fetch_and_store_data(task, urls):
+    """Fetch content from the URLs and store it to a local data file (runs on a worker thread)."""
+    with stage_report("fetch") as metrics:
+        result = download_sources(urls, "data.m3u", progress=lambda written: task.report("bytes downloaded", written))
+        add_counters(metrics, result, bytes="bytes_written")
+        add_counters(metrics, result.get("merge"), entries_written="entries_merged")
 
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # Raise an error for HTTP codes 4xx/5xx
+    if result["status"] == "not_modified":
+        print("Playlist not modified; data.m3u is up to date.")
+        return "The playlist has not changed since the last download."
+
+    print(f"Data successfully fetched and saved to data.m3u ({result['bytes']} bytes).")
+    return "Data retrieved and saved successfully!"
+
+def filter_data(task):
+    """Filter data.m3u into data-filtered.m3u (runs on a worker thread)."""
+    with stage_report("filter") as metrics:
+        stats = {}
+        entries = iter_matching_entries("data.m3u", filtered_output_path="data-filtered.m3u", stats=stats)
+        for _ in task.track(entries, "entries filtered"):
+            pass
+        add_counters(metrics, stats)
+    return "M3U file has been filtered successfully!"
+
+def create_strm_files(task):
+    """Filter data.m3u and stream the entries into the zip export (runs on a worker thread)."""
+    with stage_report("export") as metrics:
+        stats = {}
+        entries = iter_matching_entries("data.m3u", filtered_output_path="data-filtered.m3u", stats=stats)
+        summary = create_folders_and_strm_files_in_zip(task.track(entries, "entries written"))
+        add_counters(metrics, stats)
+        add_counters(metrics, summary, written="files_written", skipped="entries_skipped")
+    return "Folders and .strm files have been created!"
+
+# Error messages shown when a task fails, by task name
+TASK_ERRORS = {
+    "fetch": "Failed to fetch data. Check the URL.",
+    "filter": "An error occurred while filtering the M3U file",
+    "export": "An error occurred while creating folders and .strm files",
+}
+
+def start_task(name, target, *args):
+    """
+    Run a pipeline step on a background thread, unless a step is already running.
+
+    Steps run one at a time: they share data.m3u, its group index and data-filtered.m3u,
+    so e.g. a fetch must not replace the playlist while an export is reading it.
+    """
+    if running_tasks:
+        busy = next(iter(running_tasks))
+        messagebox.showinfo("Busy", f"The {busy} step is running. Wait for it to finish or cancel it.")
+        return
+    running_tasks[name] = BackgroundTask(name, target, task_events, *args).start()
+    cancel_button.state(["!disabled"])
+    progress_label.config(text=f"{name}: started")
 
-        with open("data.m3u", "wb") as file:
-            file.write(response.content)
+def cancel_tasks():
+    """Ask every running task to stop."""
+    for task in running_tasks.values():
+        task.cancel()
+    progress_label.config(text="Cancelling...")
 
-        success_label.config(text="Data retrieved and saved successfully!", fg="green")
-        print("Data successfully fetched and saved to data.m3u.")
+def poll_tasks():
+    """Show the progress and results reported by the background tasks."""
+    for name, kind, value in drain_events(task_events):
+        if kind == "progress":
+            label, count = value
+            progress_label.config(text=f"{name}: {count:,} {label}")
+            continue
 
-    except requests.exceptions.RequestException as e:
-        success_label.config(text="Failed to fetch data. Check the URL.", fg="red")
-        print(f"Failed to fetch data from the URL:\n{e}")
+        running_tasks.pop(name, None)
+        if kind == "done":
+            progress_label.config(text=f"{name}: finished")
+            if name == "fetch":
+                success_label.config(text=value, fg="green")
+            else:
+                messagebox.showinfo("Success", value)
+        elif kind == "cancelled":
+            progress_label.config(text=f"{name}: cancelled")
+        elif name == "fetch" and isinstance(value, requests.exceptions.RequestException):
+            progress_label.config(text=f"{name}: failed")
+            success_label.config(text=TASK_ERRORS["fetch"], fg="red")
+            print(f"Failed to fetch data from the URL:\n{value}")
+        else:
+            progress_label.config(text=f"{name}: failed")
+            messagebox.showerror("Error", f"{TASK_ERRORS.get(name, 'An error occurred')}:\n{value}")
+
+    if not running_tasks:
+        cancel_button.state(["disabled"])
+    root.after(POLL_INTERVAL, poll_tasks)
 
 def run_filterm3u():
-    """Run the `filterm3u` method."""
-    try:
-        filterm3u()
-        messagebox.showinfo("Success", "M3U file has been filtered successfully!")
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred while filtering the M3U file:\n{e}")
+    """Run the filter step in the background."""
+    start_task("filter", filter_data)
 
 def run_create_folders_and_strm():
-    """Run the `create_folders_and_strm_files` method with data-filtered.m3u."""
-    try:
-        entries = makeobject("data-filtered.m3u")
-        create_folders_and_strm_files_in_zip(entries)
-        messagebox.showinfo("Success", "Folders and .strm files have been created!")
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred while creating folders and .strm files:\n{e}")
+    """Run the export step in the background."""
+    start_task("export", create_strm_files)
 
 def run_select_groups():
     """Run the `select-groups.py` script."""
@@ -68,13 +127,13 @@ def run_select_groups():
         messagebox.showerror("Error", f"Failed to launch select-groups.py:\n{e}")
 
 def on_submit():
-    """Handle the submission of the URL."""
-    url = url_entry.get().strip()
-    if not url:
+    """Handle the submission of the URL, or of several URLs separated by spaces."""
+    urls = url_entry.get().split()
+    if not urls:
         messagebox.showerror("Error", "Please enter a valid URL.")
         return
-    save_url(url)
-    fetch_and_store_data(url)
+    save_urls(urls)
+    start_task("fetch", fetch_and_store_data, urls)
 
 # Create the main UI
 root = tk.Tk()
@@ -140,9 +199,9 @@ url_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
 url_entry = tk.Entry(url_frame, width=50)
 url_entry.grid(row=0, column=1, padx=5, pady=5)
 
-previous_url = load_url()
-if previous_url:
-    url_entry.insert(0, previous_url)
+previous_urls = load_urls()
+if previous_urls:
+    url_entry.insert(0, " ".join(previous_urls))
 
 url_entry.focus_set()
 
@@ -169,6 +228,17 @@ for i, (text, desc, command) in enumerate(button_descriptions):
 success_label = tk.Label(content_frame, text="", font=("Arial", 10), bg="#f5f5f5", fg="#333333")
 success_label.pack(pady=5)
 
+# Progress of the background tasks, with a button to cancel them
+progress_frame = tk.Frame(content_frame, bg="#f5f5f5")
+progress_frame.pack(pady=5)
+
+progress_label = tk.Label(progress_frame, text="", font=("Arial", 10), bg="#f5f5f5", fg="#333333")
+progress_label.grid(row=0, column=0, padx=10)
+
+cancel_button = ttk.Button(progress_frame, text="Cancel", command=cancel_tasks, width=12)
+cancel_button.grid(row=0, column=1, padx=10)
+cancel_button.state(["disabled"])
+
 # Footer
 footer_frame = tk.Frame(root, bg="#003366", padx=10, pady=10)
 footer_frame.pack(fill="x")
@@ -182,5 +252,6 @@ footer_label = tk.Label(
 )
 footer_label.pack()
 
-# Start the application
+# Start polling the background tasks, then the application
+root.after(POLL_INTERVAL, poll_tasks)
 root.mainloop()
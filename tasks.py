@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+This module runs long pipeline steps on background threads.
+A task reports progress through a thread-safe queue that the UI polls, and can be
+cancelled cooperatively: the task checks for cancellation whenever it reports progress.
+"""
+
+import queue
+import threading
+
+class TaskCancelled(Exception):
+    """Raised inside a task when it has been cancelled."""
+
+class BackgroundTask:
+    """
+    A function running on a worker thread that reports to a shared event queue.
+
+    Events are (task name, kind, value) tuples, where kind is 'progress', 'done',
+    'error' or 'cancelled'. For 'progress' the value is a (label, count) tuple.
+    """
+
+    def __init__(self, name, target, events, *args, **kwargs):
+        """
+        :param name: Name of the task, used to tag its events.
+        :param target: The function to run. It receives the task as its first argument.
+        :param events: The queue.Queue receiving the events.
+        """
+        self.name = name
+        self.target = target
+        self.events = events
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"task-{name}", daemon=True)
+
+    def start(self):
+        """Start the task on its worker thread."""
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        """Ask the task to stop at its next progress report."""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        """Raise TaskCancelled if the task has been cancelled."""
+        if self.cancel_event.is_set():
+            raise TaskCancelled(self.name)
+
+    def report(self, label, count):
+        """
+        Report progress, e.g. task.report('bytes downloaded', 1048576).
+
+        :raises TaskCancelled: If the task has been cancelled.
+        """
+        self.check_cancelled()
+        self.events.put((self.name, "progress", (label, count)))
+
+    def track(self, iterable, label, every=1000):
+        """
+        Pass items through while reporting how many have been seen.
+
+        :param iterable: The items to pass through, e.g. the entries of a pipeline.
+        :param label: The progress label, e.g. 'entries processed'.
+        :param every: Report every this many items.
+        :return: A generator over the same items.
+        """
+        count = 0
+        try:
+            for item in iterable:
+                yield item
+                count += 1
+                if count % every == 0:
+                    self.report(label, count)
+            self.report(label, count)
+        finally:
+            # Let a cancelled generator close its files right away
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    def _run(self):
+        try:
+            result = self.target(self, *self.args, **self.kwargs)
+        except TaskCancelled:
+            self.events.put((self.name, "cancelled", None))
+        except Exception as e:
+            self.events.put((self.name, "error", e))
+        else:
+            self.events.put((self.name, "done", result))
+
+def drain_events(events):
+    """
+    Get every event currently waiting in a queue, without blocking.
+
+    :param events: The queue.Queue to read.
+    :return: A list of (task name, kind, value) tuples.
+    """
+    drained = []
+    while True:
+        try:
+            drained.append(events.get_nowait())
+        except queue.Empty:
+            return drained
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of artwork.LogoCache and artwork.write_show_artwork against a local HTTP server.
+"""
+
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from artwork import LogoCache, write_show_artwork
+from process import ARTWORK_FILES
+
+LOGOS = {"/a.png": b"\x89PNG first logo", "/b.png": b"\x89PNG second logo"}
+
+class LogoHandler(http.server.BaseHTTPRequestHandler):
+    """Serves LOGOS with an ETag per image and conditional requests."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("If-None-Match")))
+        body = LOGOS.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ArtworkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.library_path = os.path.join(self.directory, "VOD Files")
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), LogoHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def cache(self):
+        return LogoCache(os.path.join(self.directory, "logos"))
+
+    def make_shows(self, *show_names):
+        for show_name in show_names:
+            os.makedirs(os.path.join(self.library_path, show_name))
+
+    def test_revalidation(self):
+        url = f"{self.base}/a.png"
+        with requests.Session() as session:
+            cache = self.cache()
+            path, outcome = cache.fetch(url, session)
+            self.assertEqual(outcome, "downloaded")
+            cache.save()
+
+            # A new cache reads the URL table saved by the first one
+            self.assertEqual(self.cache().fetch(url, session), (path, "revalidated"))
+
+        self.assertEqual(self.server.requests[-1], ("/a.png", '"/a.png"'))
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), LOGOS["/a.png"])
+
+    def test_one_fetch_per_url(self):
+        self.make_shows("Show 1", "Show 2", "Show 3")
+        show_logos = {"Show 1": f"{self.base}/a.png", "Show 2": f"{self.base}/a.png", "Show 3": f"{self.base}/b.png"}
+        summary = write_show_artwork(show_logos, self.library_path, cache=self.cache())
+
+        self.assertEqual(sorted(path for path, _ in self.server.requests), ["/a.png", "/b.png"])
+        self.assertEqual(summary["downloaded"], 2)
+        self.assertEqual(summary["written"], 3 * len(ARTWORK_FILES))
+        with open(os.path.join(self.library_path, "Show 2", ARTWORK_FILES[0]), "rb") as file:
+            self.assertEqual(file.read(), LOGOS["/a.png"])
+
+    def test_unchanged_files_are_kept(self):
+        self.make_shows("Show 1")
+        show_logos = {"Show 1": f"{self.base}/a.png"}
+        write_show_artwork(show_logos, self.library_path, cache=self.cache())
+        path = os.path.join(self.library_path, "Show 1", ARTWORK_FILES[0])
+        inode = os.stat(path).st_ino
+
+        summary = write_show_artwork(show_logos, self.library_path, cache=self.cache())
+        self.assertEqual(summary["revalidated"], 1)
+        self.assertEqual(summary["unchanged"], len(ARTWORK_FILES))
+        self.assertEqual(os.stat(path).st_ino, inode)
+
+    def test_failed_logo(self):
+        self.make_shows("Show 1")
+        summary = write_show_artwork({"Show 1": f"{self.base}/missing.png"}, self.library_path, cache=self.cache())
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(len(summary["failures"]), 1)
+        self.assertFalse(os.listdir(os.path.join(self.library_path, "Show 1")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of fetch.download_playlist against a local HTTP server.
+"""
+
+import gzip
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch import download_playlist, load_http_cache, save_http_cache, PARTIAL_SUFFIX
+
+PLAYLIST = b"#EXTM3U\n" + b"".join(
+    b'#EXTINF:-1 tvg-name="Show %d S01 E01" group-title="G%d",Show %d\nhttp://example.com/%d.mkv\n'
+    % (i, i % 3, i, i) for i in range(200))
+ETAG = '"v1"'
+
+class PlaylistHandler(http.server.BaseHTTPRequestHandler):
+    """Serves PLAYLIST with an ETag, conditional requests, ranges and gzip."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == ETAG:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            # A misbehaving server may answer with a range starting elsewhere
+            start = server.range_start if server.range_start is not None else start
+            self.send_response(206)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            self.send_header("Content-Length", str(len(body) - start))
+            self.end_headers()
+            self.wfile.write(body[start:])
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        if "gzip" in self.headers.get("Accept-Encoding", "") and server.gzip:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class DownloadPlaylistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.directory, "data.m3u")
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PlaylistHandler)
+        self.server.body = PLAYLIST
+        self.server.requests = []
+        self.server.gzip = False
+        self.server.range_start = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/playlist.m3u"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def read_output(self):
+        with open(self.output_path, "rb") as file:
+            return file.read()
+
+    def interrupt(self, size):
+        """Leave a partial download of the first `size` bytes, as an interrupted run would."""
+        with open(self.output_path + PARTIAL_SUFFIX, "wb") as file:
+            file.write(PLAYLIST[:size])
+        save_http_cache(self.output_path, {"url": self.url, "partial": {"etag": ETAG, "last_modified": None}})
+
+    def test_download(self):
+        result = download_playlist(self.url, self.output_path)
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(self.read_output(), PLAYLIST)
+        self.assertEqual(load_http_cache(self.output_path)["etag"], ETAG)
+        self.assertFalse(os.path.exists(self.output_path + PARTIAL_SUFFIX))
+
+    def test_not_modified(self):
+        download_playlist(self.url, self.output_path)
+        result = download_playlist(self.url, self.output_path)
+        self.assertEqual(result["status"], "not_modified")
+        self.assertEqual(self.server.requests[-1].get("If-None-Match"), ETAG)
+        self.assertEqual(self.read_output(), PLAYLIST)
+
+    def test_gzip(self):
+        self.server.gzip = True
+        download_playlist(self.url, self.output_path)
+        self.assertEqual(self.read_output(), PLAYLIST)
+
+    def test_resume(self):
+        self.interrupt(1000)
+        download_playlist(self.url, self.output_path)
+        self.assertEqual(self.server.requests[0].get("Range"), "bytes=1000-")
+        self.assertEqual(self.read_output(), PLAYLIST)
+        self.assertNotIn("partial", load_http_cache(self.output_path))
+
+    def test_complete_partial_file(self):
+        # A crash between fsync and the rename leaves a complete .part file
+        self.interrupt(len(PLAYLIST))
+        download_playlist(self.url, self.output_path)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertNotIn("Range", self.server.requests[1])
+        self.assertEqual(self.read_output(), PLAYLIST)
+
+    def test_mismatched_content_range(self):
+        self.server.range_start = 10
+        self.interrupt(1000)
+        download_playlist(self.url, self.output_path)
+        self.assertNotIn("Range", self.server.requests[-1])
+        self.assertEqual(self.read_output(), PLAYLIST)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of fetch.download_sources and fetch.merge_playlists against a local HTTP server.
+"""
+
+import hashlib
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch import download_sources, merge_playlists
+
+def playlist(*entries):
+    """:return: The bytes of a playlist of (tvg-id, tvg-name, group, url) entries."""
+    return b"#EXTM3U\n" + b"".join(
+        b'#EXTINF:-1 tvg-id="%s" tvg-name="%s" group-title="%s",%s\n%s\n'
+        % (tvg_id.encode(), tvg_name.encode(), group.encode(), tvg_name.encode(), url.encode())
+        for tvg_id, tvg_name, group, url in entries)
+
+FIRST = playlist(
+    ("cnn", "CNN", "News", "http://a/cnn"),
+    ("cnn", "CNN", "US", "http://a/cnn"),  # Listed again in another group of the same source
+    ("bbc", "BBC", "News", "http://a/bbc"),
+)
+SECOND = playlist(
+    ("cnn", "CNN", "News", "http://a/cnn"),  # Same URL as the first source
+    ("bbc", "BBC", "News", "http://b/bbc"),  # Same tvg-id and tvg-name as the first source
+    ("arte", "ARTE", "News", "http://b/arte"),
+)
+
+class SourcesHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the playlists of `server.playlists` by path, with an ETag and conditional requests."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        body = server.playlists[self.path]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class DownloadSourcesTest(unittest.TestCase):
+
+    def setUp(self):
+        # Sources are downloaded to SOURCES_DIR, relative to the working directory
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SourcesHandler)
+        self.server.playlists = {"/first.m3u": FIRST, "/second.m3u": SECOND}
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.urls = [f"{base}/first.m3u", f"{base}/second.m3u"]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def read_urls(self, path="data.m3u"):
+        with open(path, "r", encoding="utf-8") as file:
+            return [line.strip() for line in file if line.startswith("http")]
+
+    def test_merge_drops_duplicates_across_sources(self):
+        result = download_sources(self.urls)
+        self.assertEqual(result["status"], "downloaded")
+        # Both entries of CNN in the first source are kept; the second source adds only ARTE
+        self.assertEqual(self.read_urls(), ["http://a/cnn", "http://a/cnn", "http://a/bbc", "http://b/arte"])
+        self.assertEqual(result["merge"]["duplicates"], 2)
+        self.assertEqual(result["merge"]["entries_written"], 4)
+
+    def test_order_of_preference(self):
+        download_sources(list(reversed(self.urls)))
+        self.assertEqual(self.read_urls(), ["http://a/cnn", "http://b/bbc", "http://b/arte"])
+
+    def test_merge_skipped_when_no_source_changed(self):
+        download_sources(self.urls)
+        modified = os.stat("data.m3u").st_mtime_ns
+        result = download_sources(self.urls)
+        self.assertEqual(result["status"], "not_modified")
+        self.assertNotIn("merge", result)
+        self.assertEqual(os.stat("data.m3u").st_mtime_ns, modified)
+
+    def test_merge_runs_again_when_a_source_changed(self):
+        download_sources(self.urls)
+        self.server.playlists["/second.m3u"] = SECOND + b'#EXTINF:-1 tvg-id="tf1" tvg-name="TF1",TF1\nhttp://b/tf1\n'
+        result = download_sources(self.urls)
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(self.read_urls()[-1], "http://b/tf1")
+
+    def test_duplicate_source_urls(self):
+        result = download_sources(self.urls + [self.urls[0]])
+        self.assertEqual(len(result["sources"]), 2)
+        self.assertEqual(sorted(self.server.requests), ["/first.m3u", "/second.m3u"])
+
+    def test_entries_without_url(self):
+        with open("broken.m3u", "wb") as file:
+            file.write(FIRST + b'#EXTINF:-1 tvg-id="x" tvg-name="X",X\n')
+        stats = merge_playlists(["broken.m3u"], "merged.m3u")
+        self.assertEqual(stats["incomplete"], 1)
+        self.assertEqual(self.read_urls("merged.m3u"), ["http://a/cnn", "http://a/cnn", "http://a/bbc"])
+
+if __name__ == "__main__":
+    unittest.main()